@@ -0,0 +1,91 @@
+"""
+Micro-benchmark of the issue parsers over a synthetic batch of search results.
+
+    python benchmarks/parse_issues.py [--issues 100000]
+
+Checks that parse_issue returns the same records as get_info_from_issue and
+prints the time each of them takes over the whole batch.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# parse the synthetic payloads with the fallback field ids, without asking Jira
+os.environ.setdefault("JIRA_RESOLVE_FIELDS", "false")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jiraslackpm"))
+
+from jira import (SPRINT_FIELD, STORY_POINTS_FIELD, TESTER_FIELD,  # noqa: E402
+                  get_info_from_issue, parse_issue)
+
+STATUSES = [("To Do", "To Do"), ("In Progress", "Dev"), ("In Progress", "QA"), ("Done", "Done")]
+PROJECTS = ["Tyba", "Payments", "Onboarding", "Investments"]
+OFFSETS = ["-0500", "+0000", "+0100"]
+
+
+def jira_timestamp(moment: datetime, offset: str) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + "{:03d}".format(moment.microsecond // 1000) + offset
+
+
+def synthetic_issue(n: int, rng: random.Random) -> dict:
+    created = datetime(2021, 1, 1) + timedelta(seconds=rng.randrange(3600 * 24 * 365),
+                                               milliseconds=rng.randrange(1000))
+    updated = created + timedelta(seconds=rng.randrange(3600 * 24 * 30))
+    category, stage = rng.choice(STATUSES)
+    user = {"accountId": "user-{}".format(rng.randrange(200))}
+    return {
+        "id": str(10000 + n),
+        "key": "TY-{}".format(n),
+        "fields": {
+            "status": {"name": stage, "statusCategory": {"name": category}},
+            "priority": {"name": rng.choice(["High", "Medium", "Low"])},
+            "project": {"name": rng.choice(PROJECTS)},
+            "components": [{"name": "Squad {}".format(rng.randrange(5))}] if rng.random() < 0.5 else [],
+            "summary": "Synthetic issue {}".format(n),
+            "creator": user,
+            "reporter": user,
+            "assignee": user if rng.random() < 0.9 else None,
+            "created": jira_timestamp(created, rng.choice(OFFSETS)),
+            "updated": jira_timestamp(updated, rng.choice(OFFSETS)),
+            "issuetype": {"name": rng.choice(["Story", "Bug", "Task"])},
+            SPRINT_FIELD: [{"state": "closed", "name": "Sprint 1"},
+                           {"state": "active", "name": "Sprint 2"}] if rng.random() < 0.7 else None,
+            TESTER_FIELD: [user] if rng.random() < 0.6 else None,
+            STORY_POINTS_FIELD: rng.choice([1.0, 2.0, 3.0, 5.0, 8.0, None]),
+        },
+    }
+
+
+def timed(parser, issues: list) -> tuple:
+    start = time.perf_counter()
+    records = [parser(issue) for issue in issues]
+    return time.perf_counter() - start, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--issues", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    issues = [synthetic_issue(n, rng) for n in range(args.issues)]
+
+    reference_time, reference = timed(get_info_from_issue, issues)
+    fast_time, fast = timed(parse_issue, issues)
+    if reference != fast:
+        mismatch = next(i for i, (a, b) in enumerate(zip(reference, fast)) if a != b)
+        sys.exit("parse_issue differs from get_info_from_issue on issue {}".format(mismatch))
+
+    print("{} issues".format(args.issues))
+    print("get_info_from_issue: {:.2f}s ({:.1f} us/issue)".format(
+        reference_time, reference_time / args.issues * 1e6))
+    print("parse_issue:         {:.2f}s ({:.1f} us/issue)".format(
+        fast_time, fast_time / args.issues * 1e6))
+    print("speedup: {:.1f}x".format(reference_time / fast_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Ingestion and report latency of TyBot as the issue history grows, run on
+the embedded DuckDB backend over synthetic data.
+
+    python benchmarks/storage_growth.py [--scales 1000,10000,50000] [--days 90]
+
+For every scale a fresh database receives the history one day at a time,
+through the same upsert_issues used by the sync, and then every report
+query is timed against the result. Set DUCKDB_PATH to keep the database on
+disk instead of in memory. Needs the duckdb package, see requirements-dev.txt.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "jiraslackpm"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# query_manager reads its dataset from the environment at import time
+os.environ.setdefault("BQ_DATABASE", "jira")
+os.environ.setdefault("SPRINT_TABLE", "Sprint")
+os.environ.setdefault("JIRA_RESOLVE_FIELDS", "false")
+
+import google.cloud.bigquery as bigquery  # noqa: E402
+
+import query_manager  # noqa: E402
+import synthetic  # noqa: E402
+from config import Config  # noqa: E402
+from db import TyBot  # noqa: E402
+from notifications import NotificationAggregator  # noqa: E402
+from storage import DuckDBBackend  # noqa: E402
+
+SPRINT_SCHEMA = [
+    bigquery.SchemaField("name", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("start_date", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("end_date", "TIMESTAMP", mode="REQUIRED"),
+]
+
+
+def timed(function, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def run(scale: int, users: int, days: int) -> dict:
+    now = datetime.now(timezone.utc)
+    storage = DuckDBBackend(Config.DUCKDB_PATH, Config.BQ_DATABASE)
+    for table in ("Issue", "User", Config.ISSUE_CURRENT_TABLE, Config.ISSUE_STAGING_TABLE,
+                  Config.SPRINT_TABLE, Config.SYNC_STATE_TABLE, Config.WEEK_DEVS_PERFORMANCE_TABLE,
+                  Config.WEEK_SQUAD_PERFORMANCE_TABLE, Config.WEEK_TYBA_PERFORMANCE_TABLE):
+        storage.delete_table(table)
+    timings = {"issues": scale}
+    with TyBot(None, Config.BQ_DATABASE, storage=storage) as db:
+        db.initialize_tables()
+        db.write_records("User", synthetic.users(users, now), "load")
+        db.create_table(Config.SPRINT_TABLE, SPRINT_SCHEMA)
+        db.write_records(Config.SPRINT_TABLE, synthetic.sprints(now, days), "load")
+
+        history = synthetic.IssueHistory(scale, users, days, now=now)
+        snapshots = 0
+        ingest = 0.0
+        for index_date, batch in history.days_batches():
+            snapshots += len(batch)
+            ingest += timed(db.upsert_issues, batch, index_date=str(index_date), method="load")
+        timings["snapshots"] = snapshots
+        timings["ingest_s"] = ingest
+        timings["rows_per_s"] = snapshots / ingest if ingest else 0.0
+
+        notifier = NotificationAggregator()
+        reports = {
+            "synced_snapshots": lambda: db.get_synced_snapshots(now.replace(hour=0)),
+            "bad_issues": lambda: db.send_bad_issues_report(notifier=notifier),
+            "warning_qadev": lambda: db.warning_issues_qadev(1, notifier=notifier),
+            "warning_ready_dev": lambda: list(db.storage.query(
+                *query_manager.warning_issues_ready_dev(db.dataset_id))),
+            # first run merges, the second finds nothing new, the third is forced
+            "weekly_refresh": lambda: db.refresh_weekly_performance(now.date()),
+            "weekly_refresh_unchanged": lambda: db.refresh_weekly_performance(now.date()),
+            "weekly_refresh_forced": lambda: db.refresh_weekly_performance(now.date(), force=True),
+        }
+        for name, report in reports.items():
+            timings[name + "_ms"] = timed(report) * 1000
+    storage.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scales", default="1000,10000,50000",
+                        help="comma separated numbers of issues")
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args()
+
+    results = [run(int(scale), args.users, args.days) for scale in args.scales.split(",")]
+    columns = list(results[0])
+    print("\t".join(columns))
+    for result in results:
+        print("\t".join("{:.1f}".format(value) if isinstance(value, float) else str(value)
+                        for value in (result[column] for column in columns)))
+
+
+if __name__ == "__main__":
+    main()
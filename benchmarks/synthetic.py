@@ -0,0 +1,119 @@
+"""
+Synthetic Jira data shaped like the rows TyBot stores: users, sprints and
+the snapshot history of issues, as produced by `jira.parse_issue`.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+PROJECTS = ["Tyba", "Fury", "Parker", "Robo", "Groot", "Stark", "Support"]
+STAGES = [("To Do", "Backlog"), ("To Do", "Ready for Dev"), ("In Progress", "ENV: DEV"),
+          ("In Progress", "ENV: QA"), ("Done", "Done")]
+ISSUE_TYPES = ["Story", "Task", "Error", "Bug"]
+SPRINT_DAYS = 14
+
+
+def users(count: int, index_date: datetime) -> list:
+    return [
+        {
+            "account_id": "user-{}".format(n),
+            "account_type": "atlassian",
+            "active": True,
+            "display_name": "User {}".format(n),
+            "index_date": str(index_date),
+            "email": "user{}@example.com".format(n),
+        }
+        for n in range(count)
+    ]
+
+
+def sprints(now: datetime, days: int) -> list:
+    """Two week sprints covering the last `days` days, the last one still active."""
+    first_start = now - timedelta(days=days)
+    count = days // SPRINT_DAYS + 1
+    return [
+        {
+            "name": "Sprint {}".format(n),
+            "start_date": str(first_start + timedelta(days=n * SPRINT_DAYS)),
+            "end_date": str(first_start + timedelta(days=(n + 1) * SPRINT_DAYS)),
+        }
+        for n in range(count)
+    ]
+
+
+class IssueHistory(object):
+    """
+    Generates `issues` issues over the last `days` days. Every day some of
+    them move forward one stage, which yields a new snapshot per change,
+    the way the daily sync stores them.
+    """
+
+    def __init__(self, issues: int, users: int, days: int, seed: int = 7,
+                 now: datetime = None):
+        self.rng = random.Random(seed)
+        self.issues = issues
+        self.users = users
+        self.days = days
+        self.now = now or datetime.now(timezone.utc)
+        self.start = self.now - timedelta(days=days)
+        self.state = {}
+
+    def sprint_name(self, moment: datetime) -> str:
+        return "Sprint {}".format((moment - self.start).days // SPRINT_DAYS)
+
+    def snapshot(self, issue_id: int, moment: datetime) -> dict:
+        state = self.state[issue_id]
+        category, stage = STAGES[state["stage"]]
+        assignee = "user-{}".format(state["user"])
+        return {
+            "story_points": state["story_points"],
+            "status": category,
+            "stage": stage,
+            "priority": state["priority"],
+            "issue_id": str(10000 + issue_id),
+            "issue_name": "TY-{}".format(issue_id),
+            "project_name": state["project"],
+            "issue_summary": "Synthetic issue {}".format(issue_id),
+            "creator": assignee,
+            "reporter": assignee,
+            "assignee": assignee,
+            "created_at": str(state["created_at"]),
+            "updated_at": str(moment),
+            "issue_type": state["issue_type"],
+            "tester": "user-{}".format(state["tester"]) if state["tester"] is not None else None,
+            "sprint_status": "active" if self.sprint_name(moment) == self.sprint_name(self.now) else "closed",
+            "sprint_name": self.sprint_name(moment),
+        }
+
+    def days_batches(self):
+        """Yields (index_date, snapshots) for each day of history, oldest first."""
+        rng = self.rng
+        per_day = max(1, self.issues // self.days)
+        created = 0
+        for day in range(self.days + 1):
+            moment = self.start + timedelta(days=day)
+            index_date = moment + timedelta(hours=23)
+            batch = []
+            for _ in range(per_day if day < self.days else self.issues - created):
+                if created >= self.issues:
+                    break
+                created_at = moment + timedelta(seconds=rng.randrange(3600 * 20))
+                self.state[created] = {
+                    "stage": 0,
+                    "user": rng.randrange(self.users),
+                    "tester": rng.randrange(self.users) if rng.random() < 0.6 else None,
+                    "story_points": rng.choice([1.0, 2.0, 3.0, 5.0, 8.0, None]),
+                    "priority": rng.choice(["High", "Medium", "Low"]),
+                    "project": rng.choice(PROJECTS),
+                    "issue_type": rng.choice(ISSUE_TYPES),
+                    "created_at": created_at,
+                }
+                batch.append(self.snapshot(created, created_at))
+                created += 1
+            for issue_id, state in self.state.items():
+                if state["stage"] < len(STAGES) - 1 and rng.random() < 0.25:
+                    state["stage"] += 1
+                    updated_at = moment + timedelta(seconds=rng.randrange(3600 * 20, 3600 * 22))
+                    batch.append(self.snapshot(issue_id, updated_at))
+            for snapshot in batch:
+                snapshot["index_date"] = str(index_date)
+            yield index_date, batch
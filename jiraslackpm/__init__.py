@@ -1,12 +1,14 @@
-import jira
-import db
-import slack_connect
-from config import Config
+import sys
 
-def main():
-    
-    tybot = db.TyBot(Config.BQ_PROJECT, Config.BQ_DATABASE)
-    tybot.warning_issues_qadev(week=1)
+from cli import main as cli_main
+
+# the job this entry point ran before it had subcommands
+DEFAULT_COMMAND = ["report", "warnings", "--week", "1"]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    return cli_main(argv or DEFAULT_COMMAND)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
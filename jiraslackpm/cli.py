@@ -0,0 +1,142 @@
+"""
+Command line entry point of the bot.
+
+Every subcommand imports only what it needs, so a short scheduled job does
+not pay for BigQuery, pandas or Slack clients it never uses.
+"""
+import argparse
+import datetime
+import importlib
+import sys
+import time
+from typing import Optional
+
+from config import Config
+
+REPORTS = ["daily", "warnings", "bad-issues", "devs", "squads", "tyba"]
+
+
+class StartupTimer(object):
+    """
+    Records how long each import and phase of a run takes, in the spirit of
+    `python -X importtime`, to be printed to stderr at the end.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = []
+
+    def record(self, name: str, started_at: float, modules: int = 0):
+        self.phases.append((name, time.perf_counter() - started_at, modules))
+
+    def import_module(self, name: str):
+        """Imports a module, recording the time and the modules it loaded."""
+        started_at = time.perf_counter()
+        loaded = len(sys.modules)
+        module = importlib.import_module(name)
+        self.record("import " + name, started_at, len(sys.modules) - loaded)
+        return module
+
+    def report(self, stream=sys.stderr):
+        total = time.perf_counter() - self.started_at
+        print("startup timings:", file=stream)
+        for name, seconds, modules in self.phases:
+            loaded = " ({} modules)".format(modules) if modules else ""
+            print("  {:>9.1f} ms  {}{}".format(seconds * 1000, name, loaded), file=stream)
+        print("  {:>9.1f} ms  total".format(total * 1000), file=stream)
+
+
+def sync_users(args, timer: StartupTimer):
+    db = timer.import_module("db")
+    db.load_users_into_bigquery(args.project, args.database, write_method=args.write_method)
+
+
+def sync_issues(args, timer: StartupTimer):
+    db = timer.import_module("db")
+    db.load_new_issues_into_bigquery(args.project, args.database, full_resync=args.full,
+                                     bulk=args.bulk, write_method=args.write_method)
+
+
+def sync_sprints(args, timer: StartupTimer):
+    db = timer.import_module("db")
+    db.load_sprints(args.project, args.database, write_method=args.write_method, state=args.state)
+
+
+def refresh_weekly(args, timer: StartupTimer):
+    db = timer.import_module("db")
+    db.refresh_weekly_performance(args.project, args.database, index_date=args.date, force=args.force)
+
+
+def report(args, timer: StartupTimer):
+    db = timer.import_module("db")
+    with db.TyBot(args.project, args.database) as tybot:
+        if args.name == "daily":
+            tybot.send_daily_notifications(args.week, dry_run=args.dry_run, dump_path=args.dump_path)
+        elif args.name == "warnings":
+            tybot.warning_issues_qadev(week=args.week)
+        elif args.name == "bad-issues":
+            tybot.send_bad_issues_report()
+        elif args.name == "devs":
+            tybot.send_performance_devs()
+        elif args.name == "squads":
+            tybot.send_weekly_squads_performance()
+        elif args.name == "tyba":
+            tybot.send_weekly_tyba_performance()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="tybot", description="Jira to BigQuery sync and Slack reports.")
+    parser.add_argument("--project", default=Config.BQ_PROJECT, help="BigQuery project, BQ_PROJECT by default")
+    parser.add_argument("--database", default=Config.BQ_DATABASE, help="BigQuery dataset, BQ_DATABASE by default")
+    parser.add_argument("--timings", action="store_true", help="print a startup time breakdown to stderr")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    write_method = argparse.ArgumentParser(add_help=False)
+    write_method.add_argument("--write-method", choices=["load", "stream"], default=None,
+                              help="BigQuery write method, BQ_WRITE_METHOD by default")
+
+    users = subparsers.add_parser("sync-users", parents=[write_method], help="reload the users table")
+    users.set_defaults(handler=sync_users)
+
+    issues = subparsers.add_parser("sync-issues", parents=[write_method], help="sync new and updated issues")
+    issues.add_argument("--full", action="store_true", help="ignore the watermark and resync everything")
+    issues.add_argument("--bulk", action="store_true", help="one search over all issues instead of one per user")
+    issues.set_defaults(handler=sync_issues)
+
+    sprints = subparsers.add_parser("sync-sprints", parents=[write_method], help="store new sprints")
+    sprints.add_argument("--state", default=None, help='sprint states to crawl, e.g. "active,future"')
+    sprints.set_defaults(handler=sync_sprints)
+
+    weekly = subparsers.add_parser("refresh-weekly", help="recompute the weekly performance tables")
+    weekly.add_argument("--date", type=datetime.date.fromisoformat, default=None,
+                        help="index date as YYYY-MM-DD, today in UTC-5 by default")
+    weekly.add_argument("--force", action="store_true", help="refresh even if no issue changed since the last run")
+    weekly.set_defaults(handler=refresh_weekly)
+
+    reports = subparsers.add_parser("report", help="send a Slack report")
+    reports.add_argument("name", choices=REPORTS)
+    reports.add_argument("--week", type=int, choices=[1, 2], default=1, help="week of the sprint")
+    reports.add_argument("--dry-run", action="store_true", help="dump the daily messages instead of sending them")
+    reports.add_argument("--dump-path", default=None, help="file the dry run messages are written to")
+    reports.set_defaults(handler=report)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    timer = StartupTimer()
+    started_at = time.perf_counter()
+    args = build_parser().parse_args(argv)
+    timer.record("parse arguments", started_at)
+
+    started_at = time.perf_counter()
+    try:
+        args.handler(args, timer)
+    finally:
+        timer.record("run " + args.command, started_at)
+        if args.timings:
+            timer.report()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,12 +12,65 @@ class Config:
     # General Config
     BQ_PROJECT= environ.get("BQ_PROJECT")
     BQ_DATABASE=environ.get("BQ_DATABASE")
+    # "load" stages rows as NDJSON and submits one load job, "stream" uses insert_rows_json
+    BQ_WRITE_METHOD = environ.get("BQ_WRITE_METHOD", "load")
+    # "file" stages load jobs in a temporary file, "memory" keeps them in a buffer
+    BQ_LOAD_STAGING = environ.get("BQ_LOAD_STAGING", "file")
+    # results from this many rows or bytes on are read with the BigQuery Storage Read API
+    BQ_STORAGE_MIN_ROWS = int(environ.get("BQ_STORAGE_MIN_ROWS", 100000))
+    BQ_STORAGE_MIN_BYTES = int(environ.get("BQ_STORAGE_MIN_BYTES", 20 * 1024 * 1024))
+    # "bigquery", or "duckdb" to run on an embedded database (DUCKDB_PATH, in memory if unset)
+    STORAGE_BACKEND = environ.get("STORAGE_BACKEND", "bigquery")
+    DUCKDB_PATH = environ.get("DUCKDB_PATH")
     JIRA_API_EMAIL = environ.get("JIRA_API_EMAIL")
     JIRA_API_TOKEN = environ.get("JIRA_API_TOKEN")
+    JIRA_TIMEOUT = float(environ.get("JIRA_TIMEOUT", 30))
+    JIRA_MAX_RETRIES = int(environ.get("JIRA_MAX_RETRIES", 5))
+    JIRA_BACKOFF_FACTOR = float(environ.get("JIRA_BACKOFF_FACTOR", 0.5))
+    JIRA_MAX_BACKOFF = float(environ.get("JIRA_MAX_BACKOFF", 60))
+    JIRA_POOL_SIZE = int(environ.get("JIRA_POOL_SIZE", 10))
+    JIRA_MAX_WORKERS = int(environ.get("JIRA_MAX_WORKERS", 8))
+    # JQL dates are read in the timezone of the Jira account running the search
+    JIRA_TIMEZONE = environ.get("JIRA_TIMEZONE", "America/Bogota")
+    # custom field holding story points, it differs between Jira sites
+    JIRA_STORY_POINTS_FIELD = environ.get("JIRA_STORY_POINTS_FIELD", "customfield_10016")
+    # custom field ids are resolved by name from the site's field metadata,
+    # the ids above and in jira.py are used when a name cannot be found
+    JIRA_RESOLVE_FIELDS = environ.get("JIRA_RESOLVE_FIELDS", "true").lower() == "true"
+    JIRA_FIELDS_TTL = int(environ.get("JIRA_FIELDS_TTL", 3600))
+    JIRA_STORY_POINTS_FIELD_NAMES = environ.get(
+        "JIRA_STORY_POINTS_FIELD_NAMES", "Story Points,Story point estimate").split(",")
+    JIRA_SPRINT_FIELD_NAME = environ.get("JIRA_SPRINT_FIELD_NAME", "Sprint")
+    JIRA_TESTER_FIELD_NAME = environ.get("JIRA_TESTER_FIELD_NAME", "Tester")
+    JIRA_SYNC_OVERLAP_MINUTES = int(environ.get("JIRA_SYNC_OVERLAP_MINUTES", 10))
+    # SQLite file caching raw Jira GET responses, disabled when unset
+    JIRA_CACHE_PATH = environ.get("JIRA_CACHE_PATH")
+    JIRA_CACHE_MAX_MB = int(environ.get("JIRA_CACHE_MAX_MB", 256))
+    # per endpoint TTL overrides, as `path regex=seconds,...`
+    JIRA_CACHE_TTLS = environ.get("JIRA_CACHE_TTLS")
+    # replay cached responses only, without calling Jira
+    JIRA_CACHE_OFFLINE = environ.get("JIRA_CACHE_OFFLINE", "false").lower() == "true"
+    # also keep the responses with a 0 TTL, e.g. the searches, to replay them offline later
+    JIRA_CACHE_RECORD = environ.get("JIRA_CACHE_RECORD", "false").lower() == "true"
+    # saved report queries, with a {dataset} placeholder
+    QUERIES_DIR = environ.get("QUERIES_DIR", path.join(path.dirname(BASE_DIR), "data", "queries"))
+    USERS_EXPORT_PATH = environ.get(
+        "USERS_EXPORT_PATH", path.join(path.dirname(BASE_DIR), "data", "export-users.csv"))
     SLACK_OAUTH_ACCESS_TOKEN = environ.get('SLACK_OAUTH_ACCESS_TOKEN')
-    WEEK_DEVS_PERFORMANCE_TABLE = environ.get('WEEK_DEVS_PERFORMANCE_TABLE')
-    WEEK_SQUAD_PERFORMANCE_TABLE = environ.get('WEEK_SQUAD_PERFORMANCE_TABLE')
+    SLACK_USER_CACHE_TTL = int(environ.get('SLACK_USER_CACHE_TTL', 86400))
+    # JSON file keeping the email -> Slack user cache between runs, in memory only if unset
+    SLACK_USER_CACHE_PATH = environ.get('SLACK_USER_CACHE_PATH')
+    SLACK_MAX_IN_FLIGHT = int(environ.get('SLACK_MAX_IN_FLIGHT', 10))
+    SLACK_MAX_ATTEMPTS = int(environ.get('SLACK_MAX_ATTEMPTS', 5))
+    SLACK_USER_CACHE_WARM = environ.get('SLACK_USER_CACHE_WARM', 'true').lower() == 'true'
+    WEEK_DEVS_PERFORMANCE_TABLE = environ.get('WEEK_DEVS_PERFORMANCE_TABLE', 'WeekDevsPerformance')
+    WEEK_SQUAD_PERFORMANCE_TABLE = environ.get('WEEK_SQUAD_PERFORMANCE_TABLE', 'WeekSquadPerformance')
     SPRINT_TABLE = environ.get('SPRINT_TABLE')
+    SYNC_STATE_TABLE = environ.get('SYNC_STATE_TABLE', 'SyncState')
+    ISSUE_CURRENT_TABLE = environ.get('ISSUE_CURRENT_TABLE', 'IssueCurrent')
+    ISSUE_STAGING_TABLE = environ.get('ISSUE_STAGING_TABLE', 'IssueStaging')
+    # daily partitioning column of the Issue and IssueCurrent tables: updated_at or index_date
+    ISSUE_PARTITION_FIELD = environ.get('ISSUE_PARTITION_FIELD', 'updated_at')
     SLACK_SQUAD_TYBA_PROFESSIONAL = environ.get(
         'SLACK_SQUAD_TYBA_PROFESSIONAL')
     SLACK_SQUAD_BANNER = environ.get('SLACK_SQUAD_BANNER')
@@ -30,4 +83,4 @@ class Config:
     SLACK_SQUAD_STARK = environ.get('SLACK_SQUAD_STARK')
     SLACK_TEST_CHANNEL = environ.get('SLACK_TEST_CHANNEL')
     SLACK_SQUAD_TYBA_EOS = environ.get('SLACK_SQUAD_TYBA_EOS')
-    WEEK_TYBA_PERFORMANCE_TABLE = environ.get('WEEK_TYBA_PERFORMANCE_TABLE')
+    WEEK_TYBA_PERFORMANCE_TABLE = environ.get('WEEK_TYBA_PERFORMANCE_TABLE', 'WeekTybaPerformance')
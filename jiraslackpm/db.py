@@ -1,19 +1,129 @@
 import datetime as dt2
-import dateutil.parser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Iterable, Optional
 import pytz
 
-from google.api_core.exceptions import Conflict, NotFound
-from google.cloud import bigquery_storage
 import google.cloud.bigquery as bigquery
-import google.auth
 
 import query_manager as query_manager
-from jira import get_all_users, get_info_from_issue, get_all_issues_by_user, get_all_boards, get_all_sprints_by_board
 from utils import get_users_info
-from slack_connect import SlackClient
+from storage import BigQueryBackend, StorageBackend, storage_backend
 from config import Config
 
+ISSUES_SCHEMA = [
+    bigquery.SchemaField(
+        "story_points", "NUMERIC", mode="NULLABLE"),
+    bigquery.SchemaField("status", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("stage", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("priority", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("issue_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("issue_name", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField(
+        "project_name", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField(
+        "issue_summary", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("creator", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("reporter", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("assignee", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("tester", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("issue_type", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField(
+        "created_at", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField(
+        "updated_at", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField(
+        "index_date", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("sprint_status", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("sprint_name", "STRING", mode="NULLABLE"),
+]
+
+USERS_SCHEMA = [
+    bigquery.SchemaField("account_id", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField(
+        "account_type", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("active", "BOOL", mode="REQUIRED"),
+    bigquery.SchemaField(
+        "display_name", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField(
+        "index_date", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("email", "STRING", mode="NULLABLE"),
+]
+
+ISSUES_CLUSTERING = ["issue_name", "assignee", "project_name"]
+USERS_CLUSTERING = ["account_id", "email"]
+
+WEEK_DEVS_SCHEMA = [
+    bigquery.SchemaField("assignee", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("display_name", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("email", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("avg_points", "FLOAT64", mode="NULLABLE"),
+    bigquery.SchemaField("week_bugs", "INT64", mode="NULLABLE"),
+    bigquery.SchemaField("index_date", "DATE", mode="NULLABLE"),
+]
+WEEK_SQUAD_SCHEMA = [
+    bigquery.SchemaField("project_name", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("avg_points", "FLOAT64", mode="NULLABLE"),
+    bigquery.SchemaField("week_bugs", "INT64", mode="NULLABLE"),
+    bigquery.SchemaField("index_date", "DATE", mode="NULLABLE"),
+]
+WEEK_TYBA_SCHEMA = [
+    bigquery.SchemaField("avg_points", "FLOAT64", mode="NULLABLE"),
+    bigquery.SchemaField("week_bugs", "INT64", mode="NULLABLE"),
+    bigquery.SchemaField("index_date", "DATE", mode="NULLABLE"),
+]
+# saved query, table, and the columns besides index_date that identify a row
+WEEKLY_PERFORMANCE = [
+    ("metrics x week x dev", Config.WEEK_DEVS_PERFORMANCE_TABLE, ["assignee"], WEEK_DEVS_SCHEMA),
+    ("metrics x week x squad", Config.WEEK_SQUAD_PERFORMANCE_TABLE, ["project_name"], WEEK_SQUAD_SCHEMA),
+    ("metrics x week x tyba", Config.WEEK_TYBA_PERFORMANCE_TABLE, [], WEEK_TYBA_SCHEMA),
+]
+# the weekly reports are dated in Bogota time, like CURRENT_DATE("UTC-5:00")
+REPORTS_TIMEZONE = dt2.timezone(dt2.timedelta(hours=-5))
+# the saved queries look back up to 7 whole days, i.e. less than 8 days
+WEEKLY_WINDOW = dt2.timedelta(days=8)
+
+
+def reports_date() -> dt2.date:
+    """Today in the reports timezone, bound as @index_date instead of CURRENT_DATE("UTC-5:00")."""
+    return datetime.now(REPORTS_TIMEZONE).date()
+
+
+class InsertRowsError(RuntimeError):
+    """Raised once every batch was sent when streaming inserts rejected rows."""
+
+    def __init__(self, errors: list, inserted: int):
+        super().__init__("Encountered errors while inserting rows: {}".format(errors))
+        self.errors = errors
+        self.inserted = inserted
+
+
+class QueryScheduler(object):
+    """
+    Submits independent BigQuery jobs up front and waits on them together,
+    so a report takes as long as its slowest query instead of the sum of
+    all of them.
+    """
+
+    def __init__(self, client, max_workers: int = 8):
+        self.client = client
+        self.max_workers = max_workers
+        self.jobs = {}
+
+    def submit(self, name, query: str, job_config=None):
+        """Starts the query under the given name and returns its job right away."""
+        job = self.client.query(query, job_config=job_config)
+        self.jobs[name] = job
+        return job
+
+    def results(self) -> dict:
+        """Waits for every submitted job and returns its rows by name."""
+        names = list(self.jobs)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            rows = executor.map(lambda name: list(self.jobs[name].result()), names)
+            return dict(zip(names, rows))
+
+
 class TyBot(object):
     """
     This bot integrates tyba JIRA information into a BigQuery database
@@ -21,134 +131,495 @@ class TyBot(object):
     Tyba's engineering team 
     """
 
-    def __init__(self, project_id, db_name):
-        """Initialize db class variables"""
-        self.client = bigquery.Client(project=project_id)
-        self.dataset_id = "{}.{}".format(self.client.project, db_name)
-        credentials, your_project_id = google.auth.default()
-        self.bqstorageclient = bigquery_storage.BigQueryReadClient(credentials=credentials)
-        self.slack_client = SlackClient()
-
-        try:
-            dataset = bigquery.Dataset(self.dataset_id)
-            dataset = self.client.create_dataset(
-                dataset, timeout=30
-            )  # Make an API request.
-            self.dataset = dataset
-        except Conflict:
-            self.dataset = self.client.get_dataset(self.dataset_id)
+    def __init__(self, project_id, db_name, storage: Optional[StorageBackend] = None):
+        """
+        Initialize db class variables. Tables live in the backend set by
+        STORAGE_BACKEND unless a `storage` backend is given. The clients are
+        created, and the dataset checked, only when first used, so short
+        jobs do not pay for what they never touch.
+        """
+        self.project_id = project_id
+        self.db_name = db_name
+        self.owns_storage = storage is None
+        self._storage = storage
+        self._bqstorageclient = None
+        self._slack_client = None
+
+    @property
+    def storage(self) -> StorageBackend:
+        if self._storage is None:
+            self._storage = storage_backend(self.project_id, self.db_name)
+        return self._storage
+
+    @property
+    def client(self):
+        return self.storage.client
+
+    @property
+    def dataset_id(self) -> str:
+        return self.storage.dataset_id
+
+    @property
+    def dataset(self):
+        return getattr(self.storage, "dataset", None)
+
+    @property
+    def bqstorageclient(self):
+        """BigQuery Storage read client, None on other backends."""
+        if self._bqstorageclient is None and isinstance(self.storage, BigQueryBackend):
+            import google.auth
+            from google.cloud import bigquery_storage
+
+            credentials, your_project_id = google.auth.default()
+            self._bqstorageclient = bigquery_storage.BigQueryReadClient(credentials=credentials)
+        return self._bqstorageclient
+
+    @property
+    def slack_client(self):
+        if self._slack_client is None:
+            from slack_connect import SlackClient
+
+            self._slack_client = SlackClient()
+        return self._slack_client
+
+    def enqueue_direct_message(self, delivery_queue, email: str, message: str):
+        """Queues a message to the Slack user with the given email, if they are found."""
+        user = self.slack_client.get_user_by_email(email)
+        if user is None:
+            print("Fallo en encontrar el correo: ", email)
+            return
+        delivery_queue.enqueue(channel=user['id'], text=message)
 
     def __enter__(self):
         return self
 
     def __exit__(self, ext_type, exc_value, traceback):
-        self.client = None
-        self.dataset = None
+        self.close()
 
     def __del__(self):
-        self.client = None
-        self.dataset = None
+        self._storage = None
 
     def close(self):
-        self.client = None
-        self.dataset = None
+        if self.owns_storage and self._storage is not None:
+            self._storage.close()
+        self._storage = None
+        self._bqstorageclient = None
 
-    def create_table(self, table_name: str, schema: list):
+    def create_table(self, table_name: str, schema: list, partition_field: Optional[str] = None,
+                     clustering_fields: Optional[list] = None):
         """
-        Creates a table into the BigQuery project dataset
-        initialized in the object, using the schema given as parameter. 
+        Creates a table into the dataset initialized in the object,
+        using the schema given as parameter.
         """
-        table_id = "{}.{}".format(self.dataset_id, table_name)
-        try:
-            table = bigquery.Table(table_id, schema=schema)
-            table = self.client.create_table(table)
-        except Conflict:
-            table = self.client.get_table(table_id)
-        return table
+        return self.storage.create_table(table_name, schema, partition_field, clustering_fields)
+
+    def migrate_table_layout(self, table_name: str, partition_field: str, clustering_fields: list):
+        """Moves the table to the given layout, see the storage backend."""
+        return self.storage.migrate_table_layout(table_name, partition_field, clustering_fields)
+
+    def migrate_tables(self, users_table_name: str = "User", issues_table_name: str = "Issue"):
+        """Moves the users and issues tables to the partitioned and clustered layout."""
+        self.migrate_table_layout(users_table_name, "index_date", USERS_CLUSTERING)
+        self.migrate_table_layout(
+            issues_table_name, Config.ISSUE_PARTITION_FIELD, ISSUES_CLUSTERING)
+        self.migrate_table_layout(
+            Config.ISSUE_CURRENT_TABLE, Config.ISSUE_PARTITION_FIELD, ISSUES_CLUSTERING)
 
     def delete_table(self, table_name: str):
         """Deletes the table given as parameter"""
 
-        table_id = "{}.{}".format(self.dataset_id, table_name)
-        try:
-            self.client.delete_table(table_id)
-        except NotFound:
+        if not self.storage.delete_table(table_name):
             print("Table already deleted...")
 
-    def insert_records(self, table_name, records: list):
-        """inserts the records list into the table given as parameter"""
+    def insert_records(self, table_name, records: list, batch_size: int = 500):
+        """
+        inserts the records list into the table given as parameter, in
+        requests of at most `batch_size` rows, and returns the errors found
+        """
 
-        table_id = "{}.{}".format(self.dataset_id, table_name)
-        errors = self.client.insert_rows_json(table_id, records)
+        errors = []
+        for start in range(0, len(records), batch_size):
+            errors += self.storage.insert_rows(
+                table_name, records[start:start + batch_size])
         if not errors:
             print("New rows have been added.")
         else:
             print("Encountered errors while inserting rows: {}".format(errors))
+        return errors
+
+    def insert_batches(self, table_name, records: Iterable, batch_size: int = 500) -> int:
+        """
+        Consumes the records iterable, flushing it into the table given as
+        parameter every `batch_size` rows so memory stays flat and inserts
+        start before the producer is exhausted. Returns the rows sent, or
+        raises InsertRowsError once they are all sent if any was rejected.
+        """
+        batch = []
+        inserted = 0
+        errors = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                errors += self.insert_records(table_name, batch, batch_size)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            errors += self.insert_records(table_name, batch, batch_size)
+            inserted += len(batch)
+        if errors:
+            raise InsertRowsError(errors, inserted)
+        return inserted
+
+    def load_records(self, table_name, records: Iterable,
+                     write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+                     staging: Optional[str] = None, schema: Optional[list] = None) -> int:
+        """Writes the records in one bulk load of the storage backend, returns the rows written."""
+        rows = self.storage.load_rows(
+            table_name, records, schema=schema,
+            truncate=write_disposition == bigquery.WriteDisposition.WRITE_TRUNCATE,
+            staging=staging)
+        if not rows:
+            return 0
+        print("Loaded {} rows into {}.".format(rows, table_name))
+        return rows
+
+    def write_records(self, table_name, records: Iterable, method: Optional[str] = None) -> int:
+        """
+        Writes the records into the table given as parameter, with one load
+        job ("load") or with batched streaming inserts ("stream"). Defaults
+        to the BQ_WRITE_METHOD setting.
+        """
+        method = method or Config.BQ_WRITE_METHOD
+        if method == "stream":
+            return self.insert_batches(table_name, records)
+        return self.load_records(table_name, records)
+
+    def relax_columns(self, table_name: str, columns: list):
+        """Turns the REQUIRED columns given as parameter into NULLABLE ones."""
+        self.storage.relax_columns(table_name, columns)
 
     def initialize_tables(
         self, users_table_name: str = "User", issues_table_name: str = "Issue"
     ):
-        # ids to check the tables existence
-        issues_table_id = "{}.{}".format(self.dataset_id, issues_table_name)
-        users_table_id = "{}.{}".format(self.dataset_id, users_table_name)
-
         # if the user table does exist, it doesn't have to be initialized again.
-        try:
-            self.client.get_table(users_table_id)
+        if self.storage.table_exists(users_table_name):
             users = "Users are already uploaded"
 
         # if it doesn't exist, it has to be created with the following schema.
-        except NotFound:
+        else:
             self.delete_table(users_table_name)
-            users_schema = [
-                bigquery.SchemaField("account_id", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "account_type", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("active", "BOOL", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "display_name", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "index_date", "TIMESTAMP", mode="REQUIRED"),
-                bigquery.SchemaField("email", "STRING", mode="NULLABLE"),
-            ]
             print("Initializing users table...")
-            users = self.create_table(users_table_name, users_schema)
+            users = self.create_table(
+                users_table_name, USERS_SCHEMA, "index_date", USERS_CLUSTERING)
 
         # if the user table does exist, it doesn't have to be initialized again.
-        try:
-            self.client.get_table(issues_table_id)
+        if self.storage.table_exists(issues_table_name):
+            # unassigned issues are stored too, older tables required an assignee
+            self.relax_columns(issues_table_name, ["assignee"])
             issues = "Ready to upload new or updated issues for yesterday"
 
         # if it doesn't exist, it has to be created with the following schema.
-        except NotFound:
-            issues_schema = [
-                bigquery.SchemaField(
-                    "story_points", "NUMERIC", mode="NULLABLE"),
-                bigquery.SchemaField("status", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("stage", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("priority", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("issue_id", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("issue_name", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "project_name", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "issue_summary", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("creator", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("reporter", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("assignee", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("tester", "STRING", mode="NULLABLE"),
-                bigquery.SchemaField("issue_type", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "created_at", "TIMESTAMP", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "updated_at", "TIMESTAMP", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "index_date", "TIMESTAMP", mode="REQUIRED")
-            ]
+        else:
             print("Initializing issues table...")
-            issues = self.create_table(issues_table_name, issues_schema)
+            issues = self.create_table(
+                issues_table_name, ISSUES_SCHEMA, Config.ISSUE_PARTITION_FIELD, ISSUES_CLUSTERING)
+
+        self.initialize_issue_current(issues_table_name)
         return users, issues
 
+    def initialize_issue_current(self, issues_table_name: str = "Issue"):
+        """
+        Creates the current-state issues table, one row per issue_id, from the
+        latest snapshot of each issue in the history table if it is missing.
+        """
+        query = f"""
+                CREATE TABLE IF NOT EXISTS `{self.dataset_id}.{Config.ISSUE_CURRENT_TABLE}`
+                PARTITION BY DATE({Config.ISSUE_PARTITION_FIELD})
+                CLUSTER BY {", ".join(ISSUES_CLUSTERING)}
+                AS
+                SELECT
+                  *
+                FROM
+                  `{self.dataset_id}.{issues_table_name}`
+                WHERE
+                  TRUE
+                QUALIFY
+                  ROW_NUMBER() OVER (PARTITION BY issue_id ORDER BY updated_at DESC, index_date DESC) = 1
+                """
+        self.storage.query(query).result()
+
+    def upsert_issues(self, records: Iterable, index_date: str, method: Optional[str] = None,
+                      issues_table_name: str = "Issue") -> int:
+        """
+        Appends the issue snapshots to the history table and merges them into
+        the current-state table, keyed by issue_id. With load jobs the rows go
+        through a staging table first, and are appended and merged in one
+        transaction; with streaming inserts the merge reads
+        back this run's rows, identified by their `index_date`. Returns the
+        rows written. Rows rejected by streaming inserts raise InsertRowsError,
+        after the accepted ones are merged.
+        """
+        method = method or Config.BQ_WRITE_METHOD
+        issues_schema = self.storage.table_schema(issues_table_name)
+        columns = [field.name for field in issues_schema]
+        issues_table_id = "{}.{}".format(self.dataset_id, issues_table_name)
+        staging_table_id = "{}.{}".format(self.dataset_id, Config.ISSUE_STAGING_TABLE)
+
+        statements = []
+        insert_error = None
+        if method == "stream":
+            try:
+                rows = self.insert_batches(issues_table_name, records)
+            except InsertRowsError as exc:
+                rows, insert_error = exc.inserted, exc
+            source = f"""
+                    SELECT
+                      *
+                    FROM
+                      `{issues_table_id}`
+                    WHERE
+                      index_date = TIMESTAMP("{index_date}")
+                    """
+        else:
+            self.create_table(Config.ISSUE_STAGING_TABLE, issues_schema)
+            rows = self.load_records(
+                Config.ISSUE_STAGING_TABLE, records,
+                write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+                schema=issues_schema)
+            source = f"SELECT * FROM `{staging_table_id}`"
+            # history and current state move together, or a retry would skip
+            # snapshots that reached the history but never the current state
+            statements.append("BEGIN TRANSACTION;")
+            statements.append(f"""
+                    INSERT INTO `{issues_table_id}` ({", ".join(columns)})
+                    SELECT {", ".join(columns)} FROM `{staging_table_id}`;
+                    """)
+        if not rows:
+            return 0
+
+        updates = ",\n                          ".join(
+            f"{column} = latest.{column}" for column in columns if column != "issue_id")
+        statements.append(f"""
+                    MERGE `{self.dataset_id}.{Config.ISSUE_CURRENT_TABLE}` AS issue_current
+                    USING (
+                      SELECT
+                        *
+                      FROM ({source})
+                      WHERE
+                        TRUE
+                      QUALIFY
+                        ROW_NUMBER() OVER (PARTITION BY issue_id ORDER BY updated_at DESC) = 1
+                    ) AS latest
+                    ON
+                      issue_current.issue_id = latest.issue_id
+                    WHEN MATCHED AND latest.updated_at >= issue_current.updated_at THEN
+                      UPDATE SET
+                          {updates}
+                    WHEN NOT MATCHED THEN
+                      INSERT ({", ".join(columns)})
+                      VALUES ({", ".join("latest." + column for column in columns)});
+                    """)
+        if method != "stream":
+            statements.append("COMMIT TRANSACTION;")
+        self.storage.query("\n".join(statements)).result()
+        print("Merged {} issue snapshots into {}.".format(
+            rows, Config.ISSUE_CURRENT_TABLE))
+        if insert_error is not None:
+            raise insert_error
+        return rows
+
+    # -------------------------
+    # Incremental sync state
+    # -------------------------
+    def get_watermark(self, sync_name: str) -> Optional[datetime]:
+        """
+        Returns the high-water mark stored by the last successful run of the
+        sync given as parameter, or None if it never completed.
+        """
+        if not self.storage.table_exists(Config.SYNC_STATE_TABLE):
+            return None
+        table_id = "{}.{}".format(self.dataset_id, Config.SYNC_STATE_TABLE)
+
+        query = f"""
+                SELECT
+                  MAX(watermark)
+                FROM
+                  `{table_id}`
+                WHERE
+                  sync_name = "{sync_name}"
+                """
+        for row in self.storage.query(query):
+            return row[0]
+
+    def set_watermark(self, sync_name: str, watermark: datetime):
+        """Records a new high-water mark for the sync given as parameter."""
+        state_schema = [
+            bigquery.SchemaField("sync_name", "STRING", mode="REQUIRED"),
+            bigquery.SchemaField("watermark", "TIMESTAMP", mode="REQUIRED"),
+            bigquery.SchemaField("index_date", "TIMESTAMP", mode="REQUIRED"),
+        ]
+        self.create_table(Config.SYNC_STATE_TABLE, state_schema)
+        self.write_records(
+            Config.SYNC_STATE_TABLE,
+            [
+                {
+                    "sync_name": sync_name,
+                    "watermark": str(watermark),
+                    "index_date": str(datetime.now(pytz.utc)),
+                }
+            ],
+        )
+
+    def get_synced_snapshots(self, since: datetime,
+                             issues_table_name: str = Config.ISSUE_CURRENT_TABLE) -> set:
+        """
+        Returns the (issue_id, updated_at) pairs already stored for issues
+        updated from `since` on, so an incremental run only appends changes.
+        They are read from the current-state table: a streamed snapshot whose
+        merge failed is in the history only, and is written again.
+        """
+        query = f"""
+                SELECT
+                  DISTINCT issue_id,
+                  updated_at
+                FROM
+                  `{self.dataset_id}.{issues_table_name}`
+                WHERE
+                  updated_at >= TIMESTAMP("{since.isoformat()}")
+                """
+        return {(row[0], row[1]) for row in self.storage.query(query)}
+
+    # -------------------------
+    # Weekly performance
+    # -------------------------
+    def refresh_weekly_performance(self, index_date: Optional[dt2.date] = None,
+                                   force: bool = False) -> bool:
+        """
+        Computes the developer, squad and company rows of `index_date`, today
+        in UTC-5 by default, and merges them into the WEEK_*_PERFORMANCE
+        tables, replacing whatever that date had. Only the week before the
+        date is read, so the cost follows the weekly churn and not the whole
+        history. The refresh is skipped when no snapshot of that week was
+        synced since the last one, unless `force` is given. Returns whether
+        the tables were refreshed.
+        """
+        if index_date is None:
+            index_date = reports_date()
+        as_of = datetime.combine(index_date, dt2.time(), REPORTS_TIMEZONE)
+        window_start = as_of - WEEKLY_WINDOW
+
+        sync_name = "weekly_performance_{}".format(index_date)
+        synced_until = self.get_window_synced_until(window_start, as_of)
+        refreshed_until = self.get_watermark(sync_name)
+        if (not force and refreshed_until is not None
+                and (synced_until is None or synced_until <= refreshed_until)):
+            print("Weekly performance of {} is up to date.".format(index_date))
+            return False
+
+        for template, table_name, keys, schema in WEEKLY_PERFORMANCE:
+            self.create_table(table_name, schema, "index_date", keys)
+        scheduler = QueryScheduler(self.storage)
+        for template, table_name, keys, schema in WEEKLY_PERFORMANCE:
+            scheduler.submit(template, *self.weekly_performance_merge(
+                template, table_name, keys, schema, index_date, as_of, window_start))
+        scheduler.results()
+
+        self.set_watermark(sync_name, synced_until or as_of)
+        print("Refreshed the weekly performance of {}.".format(index_date))
+        return True
+
+    def get_window_synced_until(self, window_start: datetime, as_of: datetime,
+                                issues_table_name: str = "Issue") -> Optional[datetime]:
+        """When the last snapshot updated between `window_start` and `as_of` was synced."""
+        query = f"""
+                SELECT
+                  MAX(index_date)
+                FROM
+                  `{self.dataset_id}.{issues_table_name}`
+                WHERE
+                  updated_at >= @window_start
+                  AND updated_at < @as_of
+                """
+        job = self.storage.query(*query_manager.report_query(
+            query, window_start=window_start, as_of=as_of))
+        for row in job:
+            return row[0]
+
+    def weekly_performance_merge(self, template: str, table_name: str, keys: list, schema: list,
+                                 index_date: dt2.date, as_of: datetime, window_start: datetime):
+        """
+        MERGE of the rows the saved query computes for `index_date` into its
+        table, keyed by index_date and `keys`. Rows of that date the query no
+        longer returns are deleted, so running it twice leaves the same rows.
+        """
+        columns = [field.name for field in schema]
+        matches = " AND ".join(
+            "week.{0} = fresh.{0}".format(column) for column in ["index_date"] + keys)
+        updates = ",\n                      ".join(
+            f"{column} = fresh.{column}" for column in columns if column not in keys + ["index_date"])
+        query = f"""
+                MERGE `{self.dataset_id}.{table_name}` AS week
+                USING (
+                  {query_manager.saved_query(template, self.dataset_id)}
+                ) AS fresh
+                ON
+                  {matches}
+                WHEN MATCHED THEN
+                  UPDATE SET
+                      {updates}
+                WHEN NOT MATCHED THEN
+                  INSERT ({", ".join(columns)})
+                  VALUES ({", ".join("fresh." + column for column in columns)})
+                WHEN NOT MATCHED BY SOURCE AND week.index_date = @index_date THEN
+                  DELETE
+                """
+        return query_manager.report_query(
+            query, index_date=index_date, as_of=as_of, window_start=window_start)
+
+    # -------------------------
+    # Query results
+    # -------------------------
+    def fetch_rows(self, query: str, job_config=None) -> list:
+        """
+        Rows of a query, read page by page through the REST API. Meant for
+        the small results of the reports, where a Storage Read API session
+        or a DataFrame costs more than the data itself.
+        """
+        return list(self.storage.query(query, job_config=job_config).result())
+
+    def uses_storage_api(self, job) -> bool:
+        """
+        Whether the result of a finished query is large enough, in rows or
+        in bytes, to be read with the BigQuery Storage Read API.
+        """
+        destination = getattr(job, "destination", None)
+        if destination is None:
+            return False
+        table = self.client.get_table(destination)
+        return ((table.num_rows or 0) >= Config.BQ_STORAGE_MIN_ROWS
+                or (table.num_bytes or 0) >= Config.BQ_STORAGE_MIN_BYTES)
+
+    def fetch_arrow(self, query: str, job_config=None):
+        """
+        Result of a query as an Arrow table, downloaded through the Storage
+        Read API when it is large and through the REST API otherwise.
+        """
+        job = self.storage.query(query, job_config=job_config)
+        rows = job.result()
+        storage_client = self.bqstorageclient if self.uses_storage_api(job) else None
+        return rows.to_arrow(bqstorage_client=storage_client, create_bqstorage_client=False)
+
+    def iter_record_batches(self, query: str, job_config=None):
+        """
+        Arrow record batches of a query's result, for exports too large to
+        be held at once or copied into pandas. The transport is picked as in
+        `fetch_arrow`.
+        """
+        job = self.storage.query(query, job_config=job_config)
+        rows = job.result()
+        storage_client = self.bqstorageclient if self.uses_storage_api(job) else None
+        return rows.to_arrow_iterable(bqstorage_client=storage_client)
+
     # -------------------------
     # Slack tybot reports
     # -------------------------
@@ -162,11 +633,14 @@ class TyBot(object):
                     FROM
                     `{self.dataset_id}.{Config.WEEK_DEVS_PERFORMANCE_TABLE}` AS week_dev_pf
                     WHERE
-                    week_dev_pf.index_date = CURRENT_DATE("UTC-5:00")
+                    week_dev_pf.index_date = @index_date
                     ORDER BY
                     week_dev_pf.avg_points DESC
                 """
-        query_job = self.client.query(query)
+        from slack_connect import SlackDeliveryQueue
+
+        query_job = self.storage.query(*query_manager.report_query(query, index_date=reports_date()))
+        delivery_queue = SlackDeliveryQueue()
         for i, row in enumerate(query_job):
             # Row values can be accessed by field name or index.
             email, avg_points, week_bugs = row[2], row[3], row[4]
@@ -187,39 +661,36 @@ class TyBot(object):
                     - Bugs tuyos en la semana: {week_bugs}\n"""
                     if avg_points < 0.1:
                         congrats_messg += """Un promedio de puntos menor a 0.1 puede indicar que no terminaste issues esta semana (¡no hay presión! :D) o que algunos de los issues que terminaste no tenían puntos asignados. ¡Recuerda asignar puntos a tus issues!"""
-                self.slack_client.post_message_to_channel(
-                    channel=user['id'], message=congrats_messg)
+                delivery_queue.enqueue(channel=user['id'], text=congrats_messg)
             except Exception as exc:
                 print("SlackApiError:", exc,
                       "\nFallo en encontrar el correo: ", email)
+        return delivery_queue.deliver()
 
-    def send_issues_qa_no_tester_report(self, users_with_previous_bad_issues):
-        """Report all the issues without in QA without tester to their respective owners"""
+    def send_issues_qa_no_tester_report(self, users_with_previous_bad_issues, notifier=None):
+        """
+        Report all the issues without in QA without tester to their respective owners.
+        With a NotificationAggregator as `notifier` the issues are collected instead of sent.
+        """
         query = f"""
                     SELECT user.email, issue.issue_name, issue.issue_summary
-                    FROM (SELECT
-                    issue_id,
-                    issue_name,
-                    MAX(updated_at) AS last_update
                     FROM
-                    `{self.dataset_id}.Issue`
-                    GROUP BY
-                      issue_id, issue_name) AS issues_last_update,
-                      `{self.dataset_id}.Issue` AS issue,
+                      `{self.dataset_id}.{Config.ISSUE_CURRENT_TABLE}` AS issue,
                       `{self.dataset_id}.User` AS user,
                       `{self.dataset_id}.{Config.SPRINT_TABLE}` AS sprint
-                      WHERE issue.issue_id = issues_last_update.issue_id
-                      AND issue.issue_name = issues_last_update.issue_name
-                      AND issue.updated_at = issues_last_update.last_update
-                      AND issue.assignee = user.account_id
+                      WHERE issue.assignee = user.account_id
+                      AND user.email IS NOT NULL
                       AND issue.sprint_name = sprint.name
-                      AND sprint.start_date <= CURRENT_TIMESTAMP() 
-                      AND sprint.end_date >= CURRENT_TIMESTAMP() 
+                      AND sprint.start_date <= @as_of
+                      AND sprint.end_date >= @as_of
                       AND issue.sprint_status = "active"
                       AND issue.stage = "ENV: QA"
                       AND issue.tester IS NULL
                  """
-        query_job = self.client.query(query)
+        from slack_connect import SlackDeliveryQueue
+
+        query_job = self.storage.query(*query_manager.report_query(
+            query, as_of=query_manager.report_as_of()))
         bad_issues_by_user = {}
         for row in query_job:
             user_email = row[0]
@@ -234,7 +705,12 @@ class TyBot(object):
             }
             bad_issues_by_user[user_email].append(new_bad_issue)
 
+        delivery_queue = SlackDeliveryQueue()
         for user_email in bad_issues_by_user:
+            if notifier is not None:
+                notifier.add(user_email, "Issues en QA sin tester asignado",
+                             bad_issues_by_user[user_email])
+                continue
             if(user_email in users_with_previous_bad_issues):
                 mssg = f"""También encontré algunos Issues en QA a los que no les fue asignado un tester. Por favor revísalos y en lo posible agregales un tester :smile::\n"""
             else:
@@ -243,12 +719,14 @@ class TyBot(object):
             for bad_issue in bad_issues_by_user[user_email]:
                 mssg += " - ID del Issue: " + bad_issue["name"] + "\n"
                 mssg += " - Descripción: " + bad_issue["summary"] + "\n"
-            user = self.slack_client.get_user_by_email(user_email)
-            self.slack_client.post_message_to_channel(
-                channel=user['id'], message=mssg)
+            self.enqueue_direct_message(delivery_queue, user_email, mssg)
+        return delivery_queue.deliver()
 
-    def send_bad_issues_report(self):
-        """Report all the issues without story points to their respective owners"""
+    def send_bad_issues_report(self, notifier=None):
+        """
+        Report all the issues without story points to their respective owners.
+        With a NotificationAggregator as `notifier` the issues are collected instead of sent.
+        """
 
         query = f"""
                     SELECT
@@ -261,25 +739,22 @@ class TyBot(object):
                     issue.updated_at,
                     issue.index_date
                     FROM
-                    `{self.dataset_id}.Issue` AS issue,
+                    `{self.dataset_id}.{Config.ISSUE_CURRENT_TABLE}` AS issue,
                     `{self.dataset_id}.User` AS user
                     WHERE
                     user.account_id = issue.assignee
+                    AND user.email IS NOT NULL
                     AND issue.story_points IS NULL
                     AND issue.issue_type != "Error"
                     AND issue.stage != "Backlog"
                     AND issue.stage != "Ready for Dev"
                     AND issue.stage != "Done"
-                    AND TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), issue.updated_at, HOUR) <= 24
-                    AND issue.updated_at IN (
-                        SELECT
-                            MAX(updated_at)
-                        FROM
-                            `{self.dataset_id}.Issue` AS issue
-                        GROUP BY
-                            issue.issue_name)
+                    AND TIMESTAMP_DIFF(@as_of, issue.updated_at, HOUR) <= 24
                  """
-        query_job = self.client.query(query)
+        from slack_connect import SlackDeliveryQueue
+
+        query_job = self.storage.query(*query_manager.report_query(
+            query, as_of=query_manager.report_as_of()))
         bad_issues_by_user = {}
         for row in query_job:
             user_email = row[0]
@@ -296,49 +771,35 @@ class TyBot(object):
             }
             bad_issues_by_user[user_email].append(new_bad_issue)
 
+        delivery_queue = SlackDeliveryQueue()
         for user_email in bad_issues_by_user:
+            if notifier is not None:
+                notifier.add(user_email, "Issues sin story points",
+                             bad_issues_by_user[user_email])
+                continue
             mssg = f"""¡Hola! Soy yo de nuevo :smile: \n
             Encontré algunos Issues asignados a tí sin story points :cry:, ¡por favor révisalos y agrégales los puntos para tenerlos en cuenta en el cálculo de performance!:\n"""
             for bad_issue in bad_issues_by_user[user_email]:
                 mssg += " - ID del Issue: " + bad_issue["name"] + "\n"
                 mssg += " - Descripción: " + bad_issue["summary"] + "\n"
                 mssg += " - Prioridad: " + bad_issue["priority"] + "\n \n"
-            user = self.slack_client.get_user_by_email(user_email)
-            self.slack_client.post_message_to_channel(
-                channel=user['id'], message=mssg)
+            self.enqueue_direct_message(delivery_queue, user_email, mssg)
+        results = delivery_queue.deliver()
 
-        self.send_issues_qa_no_tester_report(bad_issues_by_user)
+        return results + self.send_issues_qa_no_tester_report(bad_issues_by_user, notifier)
 
-    def get_weekly_squads_bug_detail(self, squad_name):
-        query = f"""
-                         SELECT
-                           processed.issue_summary,
-                           processed.issue_name,
-                           issue.project_name,
-                           user.email
-                         FROM (
-                           SELECT
-                             issue_summary,
-                             issue_name,
-                             MAX(updated_at) AS updated_at
-                           FROM
-                             `{self.dataset_id}.Issue`
-                           WHERE
-                             DATE(created_at)>=CURRENT_DATE("UTC-5:00")-7
-                             AND issue_type = "Error"
-                             AND project_name != "Support"
-                           GROUP BY
-                             issue_summary,
-                             issue_name) AS processed,
-                          `{self.dataset_id}.Issue` AS issue,
-                          `{self.dataset_id}.User` AS user
-                         WHERE
-                           issue.issue_name = processed.issue_name
-                           AND issue.updated_at = processed.updated_at
-                           AND issue.project_name = "{squad_name}"
-                           AND issue.assignee = user.account_id
-                    """
-        return self.client.query(query)
+    def send_daily_notifications(self, week, dry_run=False, dump_path=None):
+        """
+        Runs the daily issue reports and sends every person a single message
+        with all their findings. With `dry_run` the messages are dumped to
+        stdout, or to `dump_path`, instead of being sent.
+        """
+        from notifications import NotificationAggregator
+
+        notifier = NotificationAggregator()
+        self.send_bad_issues_report(notifier=notifier)
+        self.warning_issues_qadev(week, notifier=notifier)
+        return notifier.flush(self.slack_client, dry_run=dry_run, dump_path=dump_path)
 
     def send_weekly_squads_performance(self):
         query = f"""
@@ -347,7 +808,7 @@ class TyBot(object):
                     FROM
                     `{self.dataset_id}.{Config.WEEK_SQUAD_PERFORMANCE_TABLE}` AS week_squad_pf
                     WHERE
-                    week_squad_pf.index_date = CURRENT_DATE("UTC-5:00")
+                    week_squad_pf.index_date = @index_date
                     ORDER BY
                     week_squad_pf.avg_points DESC
                  """
@@ -364,25 +825,41 @@ class TyBot(object):
             "Stark": Config.SLACK_SQUAD_STARK,
             "TybaCO": Config.SLACK_SQUAD_TYBACO,
         }
-        query_job = self.client.query(query)
-        for row in query_job:
+        from slack_connect import SlackDeliveryQueue
+
+        # three set-based queries cover every squad, however many there are
+        scheduler = QueryScheduler(self.storage)
+        index_date = reports_date()
+        scheduler.submit("performance", *query_manager.report_query(query, index_date=index_date))
+        scheduler.submit("bugs_trend", self.weekly_squads_bugs_trend_query())
+        scheduler.submit("bugs_detail", *self.weekly_squads_bug_detail_query(index_date=index_date))
+        results = scheduler.results()
+
+        bugs_trend = {row["project_name"]: row for row in results["bugs_trend"]}
+        bugs_detail_by_squad = {}
+        for row in results["bugs_detail"]:
+            bugs_detail_by_squad.setdefault(row["project_name"], []).append(row)
+
+        delivery_queue = SlackDeliveryQueue()
+        for row in results["performance"]:
             squad, avg_point, week_bugs = row[0], row[1], row[2]
             print(squad)
             mssg = f"""Hola :smile:, el rendimiento de {squad} en su última semana fue:\n
             - Promedio de story points/día del equipo: {avg_point}\n
             - Total de bugs en la semana: {week_bugs}\n"""
 
-            bugs_percentage = self.weekly_percentage_bugs_report(squad=squad)
-            mssg += bugs_percentage
+            trend = bugs_trend.get(squad)
+            if trend is not None and trend["last_week_bugs"] is not None:
+                mssg += self.format_bugs_percentage(
+                    trend["week_bugs"], trend["last_week_bugs"])
 
             #self.slack_client.post_message_to_channel(
             #    channel=Config.SLACK_TEST_CHANNEL, message=mssg)
 
-            self.slack_client.post_message_to_channel(
-                channel=squad_params[squad], message=mssg)
+            delivery_queue.enqueue(channel=squad_params[squad], text=mssg)
 
             if(week_bugs > 0):
-                bugs_detail = self.get_weekly_squads_bug_detail(squad)
+                bugs_detail = bugs_detail_by_squad.get(squad, [])
                 mssg = "------------------ \n"
                 mssg += f"""Este es un resumen de los bugs en producción de la semana:\n"""
                 for row in bugs_detail:
@@ -393,8 +870,8 @@ class TyBot(object):
                 #self.slack_client.post_message_to_channel(
                 #   channel=Config.SLACK_TEST_CHANNEL, message=mssg)
 
-                self.slack_client.post_message_to_channel(
-                    channel=Config.SLACK_TEST_CHANNEL, message=mssg)
+                delivery_queue.enqueue(channel=Config.SLACK_TEST_CHANNEL, text=mssg)
+        return delivery_queue.deliver()
 
     def send_weekly_tyba_performance(self):
         query = f"""
@@ -403,12 +880,19 @@ class TyBot(object):
                 FROM
                 `{self.dataset_id}.{Config.WEEK_TYBA_PERFORMANCE_TABLE}` AS week_tyba_pf
                 WHERE
-                week_tyba_pf.index_date = CURRENT_DATE("UTC-5:00")
+                week_tyba_pf.index_date = @index_date
                 ORDER BY
                 week_tyba_pf.avg_points DESC
                 """
-        query_job = self.client.query(query)
-        for row in query_job:
+        from slack_connect import SlackDeliveryQueue
+
+        scheduler = QueryScheduler(self.storage)
+        scheduler.submit("performance", *query_manager.report_query(query, index_date=reports_date()))
+        scheduler.submit("bugs_percentage", *self.weekly_bugs_query())
+        results = scheduler.results()
+
+        delivery_queue = SlackDeliveryQueue()
+        for row in results["performance"]:
             print(row)
             avg_point, week_bugs = row[0], row[1]
             mssg = f"""¡Hola! :smile: Este es el reporte semanal de Tyba.\n
@@ -417,43 +901,60 @@ class TyBot(object):
             _*La productividad se calcula como story points/tiempo de resolución en días de los issues terminados en el transcurso de la semana._
             _*Se considera terminado un issue cuando llega a dev_
             """
-            mssg += ("\n" + self.weekly_percentage_bugs_report())
-            self.slack_client.post_message_to_channel(
-                channel=Config.SLACK_TEST_CHANNEL, message=mssg)
+            mssg += ("\n" + self.bugs_percentage_message(results["bugs_percentage"]))
+            delivery_queue.enqueue(channel=Config.SLACK_TEST_CHANNEL, text=mssg)
             #self.slack_client.post_message_to_channel(
             #    channel=Config.SLACK_SQUAD_TYBA_EOS, message=mssg)
+        return delivery_queue.deliver()
 
-    def get_weekly_squads_bug_detail(self, squad_name):
+    def weekly_squads_bug_detail_query(self, squad_name=None, index_date=None):
+        """
+        Production bugs of the two weeks before `index_date` (today by default)
+        of a squad, or of every squad when none is given.
+        """
         query = f"""
                          SELECT
-                           processed.issue_summary,
-                           processed.issue_name,
+                           issue.issue_summary,
+                           issue.issue_name,
                            issue.project_name,
                            issue.assignee
-                         FROM (
-                           SELECT
-                             issue_summary,
-                             issue_name,
-                             MAX(updated_at) AS updated_at
-                           FROM
-                             `{self.dataset_id}.Issue`
-                           WHERE
-                             DATE(created_at)>=CURRENT_DATE("UTC-5:00")-14
-                             AND issue_type = "Error"
-                             AND project_name != "Support"
-                           GROUP BY
-                             issue_summary,
-                             issue_name) AS processed,
-                          `{self.dataset_id}.Issue` AS issue
+                         FROM
+                           `{self.dataset_id}.{Config.ISSUE_CURRENT_TABLE}` AS issue
                          WHERE
-                           issue.issue_name = processed.issue_name
-                           AND issue.updated_at = processed.updated_at
-                           AND issue.project_name = '{squad_name}'
+                           DATE(issue.created_at)>=@index_date-14
+                           AND issue.issue_type = "Error"
+                           AND (@squad IS NULL OR issue.project_name = @squad)
+                         ORDER BY
+                           issue.project_name
                     """
-        return self.client.query(query)
+        return query_manager.report_query(query, squad=("STRING", squad_name),
+                                          index_date=index_date or reports_date())
 
-    def weekly_percentage_bugs_report(self, squad=None):
-        query = ""
+    def weekly_squads_bugs_trend_query(self):
+        """Bugs of the last two weekly rows of every squad, side by side."""
+        query = f"""
+                    SELECT
+                      project_name,
+                      week_bugs,
+                      last_week_bugs
+                    FROM (
+                      SELECT
+                        project_name,
+                        week_bugs,
+                        LEAD(week_bugs) OVER (PARTITION BY project_name ORDER BY index_date DESC) AS last_week_bugs,
+                        ROW_NUMBER() OVER (PARTITION BY project_name ORDER BY index_date DESC) AS week_rank
+                      FROM
+                        `{self.dataset_id}.{Config.WEEK_SQUAD_PERFORMANCE_TABLE}`)
+                    WHERE
+                      week_rank = 1
+                 """
+        return query
+
+    def get_weekly_squads_bug_detail(self, squad_name):
+        return self.storage.query(*self.weekly_squads_bug_detail_query(squad_name))
+
+    def weekly_bugs_query(self, squad=None):
+        """Last two weekly performance rows of the whole team, or of a squad."""
         if squad == None:
             query = f"""
                     SELECT
@@ -464,6 +965,7 @@ class TyBot(object):
                         index_date DESC
                     LIMIT 2;
                     """
+            return query_manager.report_query(query)
         else:
             query = f"""
                     SELECT
@@ -471,19 +973,23 @@ class TyBot(object):
                     FROM
                         `{self.dataset_id}.{Config.WEEK_SQUAD_PERFORMANCE_TABLE}`
                     WHERE
-                        project_name = '{squad}'
+                        project_name = @squad
                     ORDER BY
                         index_date DESC
                     LIMIT 2;
                     """
-            
-        dataframe = (self.client.query(query)
-                    .result()
-                    .to_dataframe(bqstorage_client=self.bqstorageclient)
-                    )
-        current_week_bugs = dataframe['week_bugs'].iloc[0]
-        last_week_bugs = dataframe['week_bugs'].iloc[1]
+            return query_manager.report_query(query, squad=squad)
+
+    def weekly_percentage_bugs_report(self, squad=None):
+        # two rows, plain iteration beats a Storage Read session and a DataFrame
+        return self.bugs_percentage_message(self.fetch_rows(*self.weekly_bugs_query(squad)))
+
+    def bugs_percentage_message(self, rows):
+        """Formats the week over week bugs change from the rows of `weekly_bugs_query`."""
+        return self.format_bugs_percentage(rows[0]["week_bugs"], rows[1]["week_bugs"])
 
+    @staticmethod
+    def format_bugs_percentage(current_week_bugs, last_week_bugs):
         mssg = ""
         if last_week_bugs != 0 and current_week_bugs > last_week_bugs:
             increase_bugs_percentage = round(((current_week_bugs/last_week_bugs)-1),2)*100
@@ -517,7 +1023,8 @@ class TyBot(object):
             days_in_val = row[3]
 
             now = datetime.now()
-            sprint_start_date = datetime.strptime(issue_sprint_start_date, "%Y-%m-%d")
+            # start_date comes back as a string, a date or a timestamp depending on the column type
+            sprint_start_date = datetime.strptime(str(issue_sprint_start_date)[:10], "%Y-%m-%d")
             sprint_days = abs((now - sprint_start_date).days)
 
             new_issue = {
@@ -531,85 +1038,62 @@ class TyBot(object):
         return issues_by_user
 
 
-    def warning_issues_qadev(self, week):
-        query_qa = query_manager.warning_issues_qa()
-        query_dev = query_manager.warning_issues_dev()
-
-        query_qa_result = self.client.query(query_qa)
-        query_dev_result = self.client.query(query_dev)
-
-        warning_issues_qa = self.process_warning_issues(query_qa_result, "qa")
-        warning_issues_dev = self.process_warning_issues(query_dev_result, "dev")
+    def warning_issues_qadev(self, week, notifier=None):
+        """
+        Warn the owners of the issues stuck in QA or DEV during the first
+        (`week` 1) or second (`week` 2) week of the sprint. With a
+        NotificationAggregator as `notifier` the issues are collected instead of sent.
+        """
+        from slack_connect import SlackDeliveryQueue
+
+        scheduler = QueryScheduler(self.storage)
+        scheduler.submit("qa", *query_manager.warning_issues_qa(self.dataset_id))
+        scheduler.submit("dev", *query_manager.warning_issues_dev(self.dataset_id))
+        results = scheduler.results()
+
+        warning_issues_qa = self.process_warning_issues(results["qa"], "qa")
+        warning_issues_dev = self.process_warning_issues(results["dev"], "dev")
+        delivery_queue = SlackDeliveryQueue()
+
+        def warn(warning_issues, stage, is_late):
+            for user_email in warning_issues:
+                late_issues = [warning_issue for warning_issue in warning_issues[user_email]
+                               if is_late(warning_issue)]
+                if not late_issues:
+                    continue
+                if notifier is not None:
+                    notifier.add(user_email, f"Issues con más de 3 días en {stage}", late_issues)
+                    continue
+                warning_issues_str = ""
+                for warning_issue in late_issues:
+                    warning_issues_str += " - ID del Issue: " + warning_issue["name"] + "\n"
+                    warning_issues_str += " - Descripción: " + warning_issue["summary"] + "\n"
+                warning_issues_start = f"¡Hola! Noté que algunos issues asignados a ti llevan más de 3 días en {stage}. Aquí va el detalle:\n"
+                warning_issues_end = "¡Ánimo! Ve con toda la energía en este sprint :smile:"
+                warning_issues_mssg = warning_issues_start + warning_issues_str + warning_issues_end
+                self.enqueue_direct_message(delivery_queue, user_email, warning_issues_mssg)
 
         if week == 1:
-            for user_email in warning_issues_qa:
-                issues_count = 0
-                warning_issues_str = ""
-                for warning_issue in warning_issues_qa[user_email]:
-                    if warning_issue["days_in_qa"] == 4 and warning_issue["sprint_days"] <= 7:
-                        issues_count+=1
-                        warning_issues_str += " - ID del Issue: " + warning_issue["name"] + "\n"
-                        warning_issues_str += " - Descripción: " + warning_issue["summary"] + "\n"
-                if issues_count != 0:
-                    warning_issues_start = "¡Hola! Noté que algunos issues asignados a ti llevan más de 3 días en QA. Aquí va el detalle:\n"
-                    warning_issues_end = "¡Ánimo! Ve con toda la energía en este sprint :smile:"
-                    warning_issues_mssg = warning_issues_start + warning_issues_str + warning_issues_end
-                    #print(warning_issues_mssg)
-                    user = self.slack_client.get_user_by_email(user_email)
-                    self.slack_client.post_message_to_channel(channel=user['id'], message=warning_issues_mssg)
-
-            for user_email in warning_issues_dev:
-                issues_count = 0
-                warning_issues_str = ""
-                for warning_issue in warning_issues_dev[user_email]:
-                    if warning_issue["days_in_dev"] == 4 and warning_issue["sprint_days"] <= 7:
-                        issues_count+=1
-                        warning_issues_str += " - ID del Issue: " + warning_issue["name"] + "\n"
-                        warning_issues_str += " - Descripción: " + warning_issue["summary"] + "\n"
-                if issues_count != 0:
-                    warning_issues_start = "¡Hola! Noté que algunos issues asignados a ti llevan más de 3 días en DEV. Aquí va el detalle:\n"
-                    warning_issues_end = "¡Ánimo! Ve con toda la energía en este sprint :smile:"
-                    warning_issues_mssg = warning_issues_start + warning_issues_str + warning_issues_end
-                    #print(warning_issues_mssg)
-                    user = self.slack_client.get_user_by_email(user_email)
-                    self.slack_client.post_message_to_channel(channel=user['id'], message=warning_issues_mssg)
+            warn(warning_issues_qa, "QA",
+                 lambda issue: issue["days_in_qa"] == 4 and issue["sprint_days"] <= 7)
+            warn(warning_issues_dev, "DEV",
+                 lambda issue: issue["days_in_dev"] == 4 and issue["sprint_days"] <= 7)
 
         elif week == 2:
-            for user_email in warning_issues_qa:
-                issues_count = 0
-                warning_issues_str = ""
-                for warning_issue in warning_issues_qa[user_email]:
-                    if warning_issue["days_in_qa"] >= 3 and warning_issue["sprint_days"] > 7:
-                        issues_count+=1
-                        warning_issues_str += " - ID del Issue: " + warning_issue["name"] + "\n"
-                        warning_issues_str += " - Descripción: " + warning_issue["summary"] + "\n"
-                if issues_count != 0:
-                    warning_issues_start = "¡Hola! Noté que algunos issues asignados a ti llevan más de 3 días en QA. Aquí va el detalle:\n"
-                    warning_issues_end = "¡Ánimo! Ve con toda la energía en este sprint :smile:"
-                    warning_issues_mssg = warning_issues_start + warning_issues_str + warning_issues_end
-                    #print(warning_issues_mssg)
-                    user = self.slack_client.get_user_by_email(user_email)
-                    self.slack_client.post_message_to_channel(channel=user['id'], message=warning_issues_mssg)
-            
-            for user_email in warning_issues_dev:
-                issues_count = 0
-                warning_issues_str = ""
-                for warning_issue in warning_issues_dev[user_email]:
-                    if warning_issue["days_in_dev"] >= 3 and warning_issue["sprint_days"] > 7:
-                        issues_count+=1
-                        warning_issues_str += " - ID del Issue: " + warning_issue["name"] + "\n"
-                        warning_issues_str += " - Descripción: " + warning_issue["summary"] + "\n"
-                if issues_count != 0:
-                    warning_issues_start = "¡Hola! Noté que algunos issues asignados a ti llevan más de 3 días en DEV. Aquí va el detalle:\n"
-                    warning_issues_end = "¡Ánimo! Ve con toda la energía en este sprint :smile:"
-                    warning_issues_mssg = warning_issues_start + warning_issues_str + warning_issues_end
-                    user = self.slack_client.get_user_by_email(user_email)
-                    self.slack_client.post_message_to_channel(channel=user['id'], message=warning_issues_mssg)
-        
-    def warning_issues_ready_dev():
-        query_ready_dev = query_manager.warning_issues_ready_dev()
-        query_ready_dev_result = self.client.query(query_ready_dev)
-        warning_issues_ready_dev = self.process_warning_issues(query_qa_result, "ready_dev")
+            warn(warning_issues_qa, "QA",
+                 lambda issue: issue["days_in_qa"] >= 3 and issue["sprint_days"] > 7)
+            warn(warning_issues_dev, "DEV",
+                 lambda issue: issue["days_in_dev"] >= 3 and issue["sprint_days"] > 7)
+        return delivery_queue.deliver()
+
+    def warning_issues_ready_dev(self):
+        """Warn the owners of the issues of the active sprint waiting in 'Ready for Dev'."""
+        from slack_connect import SlackDeliveryQueue
+
+        query_ready_dev = query_manager.warning_issues_ready_dev(self.dataset_id)
+        query_ready_dev_result = self.storage.query(*query_ready_dev)
+        warning_issues_ready_dev = self.process_warning_issues(query_ready_dev_result, "ready_dev")
+        delivery_queue = SlackDeliveryQueue()
         for user_email in warning_issues_ready_dev:
             issues_count = 0
             warning_issues_str = ""
@@ -621,105 +1105,133 @@ class TyBot(object):
                 warning_issues_start = "¡Hola! Noté que algunos issues asignados a ti llevan más de 7 días en 'Ready for DEV'. Aquí va el detalle:\n"
                 warning_issues_end = "¡Ánimo! Ve con toda la energía en este sprint :smile:"
                 warning_issues_mssg = warning_issues_start + warning_issues_str + warning_issues_end
-                user = self.slack_client.get_user_by_email(user_email)
-                self.slack_client.post_message_to_channel(channel=user['id'], message=warning_issues_mssg)
+                self.enqueue_direct_message(delivery_queue, user_email, warning_issues_mssg)
+        return delivery_queue.deliver()
 ####
 
 # -------------
 # End of tybot
 # -------------
 
-def load_users_into_bigquery(project_id, database_name):
+def load_users_into_bigquery(project_id, database_name, write_method=None):
+    """
+    Replaces the User table with the active Atlassian accounts of Jira, joined
+    with their email from the users export. Accounts missing from the export
+    are stored without email.
+    """
+    from jira import get_all_users
+
     with TyBot(project_id, database_name) as db:
         db.delete_table("User")
-        users_table_id = "{}.{}".format(db.dataset_id, "User")
-        # if the user table does exist, it doesn't have to be initialized again.
-        try:
-            db.client.get_table(users_table_id)
-            users = "Users are already uploaded"
+        print("Initializing users table...")
+        db.create_table("User", USERS_SCHEMA, "index_date", USERS_CLUSTERING)
+
+        info_users = get_users_info()
+        # account id -> email index, built once instead of scanning the export per user
+        info_users = info_users.dropna(subset=['email']).drop_duplicates('id')
+        emails = dict(zip(info_users['id'], info_users['email']))
+        u = datetime.utcnow()
+        now = u.replace(tzinfo=pytz.timezone("America/Bogota"))
+
+        records = [
+            {
+                "account_id": user["accountId"],
+                "account_type": user["accountType"],
+                "active": user["active"],
+                "display_name": user["displayName"],
+                "index_date": str(now),
+                "email": emails.get(user["accountId"]),
+            }
+            for user in get_all_users()
+            if user["accountType"] == "atlassian" and user['active'] == True
+        ]
+        unmatched = [record for record in records if record["email"] is None]
+        for record in unmatched:
+            print("User with ID {} and name {} is not in the users export, storing it without email".format(
+                record["account_id"], record["display_name"]))
+
+        inserted = db.write_records("User", records, write_method)
+        print("Inserted {} users, {} of them without email".format(
+            inserted, len(unmatched)))
+
+
+def load_new_issues_into_bigquery(project_id, database_name, full_resync=False, bulk=False,
+                                  write_method=None):
+    """
+    Appends a snapshot of every issue changed since the last successful sync.
+    With `full_resync`, or on the first run, every issue is downloaded again.
+    With `bulk` the issues are pulled by one site-wide search instead of one
+    search per user, which also captures unassigned issues. `write_method`
+    picks between one load job and streaming inserts, see `write_records`.
+    """
+    from jira import (get_all_users, issue_fields, iter_all_issues, iter_all_issues_by_user,
+                      jql_since, parse_issue, parse_jira_datetime)
 
-        # if it doesn't exist, it has to be created with the following schema.
-        except NotFound:
-            users_schema = [
-                bigquery.SchemaField("account_id", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "account_type", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("active", "BOOL", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "display_name", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField(
-                    "index_date", "TIMESTAMP", mode="REQUIRED"),
-                bigquery.SchemaField("email", "STRING", mode="NULLABLE"),
-            ]
-            print("Initializing users table...")
-            users = db.create_table("User", users_schema)
-            users = get_all_users()
-            info_users = get_users_info()
-            u = datetime.utcnow()
-            now = u.replace(tzinfo=pytz.timezone("America/Bogota"))
-
-        for user in users:
-            if user["accountType"] == "atlassian" and user['active'] == True:
-                db.insert_records(
-                    "User",
-                    [
-                        {
-                            "account_id": user["accountId"],
-                            "account_type": user["accountType"],
-                            "active": user["active"],
-                            "display_name": user["displayName"],
-                            "index_date": str(now),
-                            "email": info_users[info_users['id'] == user["accountId"]]['email'].iloc[0],
-                        }
-                    ],
-                )
-                print("Inserted user with ID {} and name {}".format(
-                    user["accountId"], user["displayName"]))
-
-
-def load_new_issues_into_bigquery(project_id, database_name):
     with TyBot(project_id, database_name) as db:
         users_table, issues_table = db.initialize_tables()
         print(users_table, issues_table)
-        users = get_all_users()
+
+        watermark = None if full_resync else db.get_watermark("issues")
+        synced = set()
+        if watermark is not None:
+            # the same bound the searches use, so nothing they return is missing here
+            synced = db.get_synced_snapshots(jql_since(watermark))
+            print("Syncing issues updated since {}".format(watermark))
+        else:
+            print("Running a full resync of issues")
+        # the crawl takes a while and is no snapshot: the next run searches from
+        # when this one started, so issues changed behind it are fetched again
+        started_at = datetime.now(pytz.utc)
+
         u = datetime.utcnow()
         now = u.replace(tzinfo=pytz.timezone("America/Bogota"))
-        for user in users:
 
-            if user["accountType"] == "atlassian":
+        def issue_pages():
+            # only download the fields the parser reads
+            fields = issue_fields()
+            if bulk:
+                yield from iter_all_issues(updated_since=watermark, fields=fields)
+                return
+            for user in get_all_users():
+                if user["accountType"] == "atlassian":
+                    print("Fetching issues for user ID: {}".format(user["accountId"]))
+                    yield from iter_all_issues_by_user(
+                        user["accountId"], updated_since=watermark, fields=fields)
+                else:
+                    print(
+                        "User with ID {} is of type {}. Skipping issues fetch..".format(
+                            user["accountId"], user["accountType"]
+                        )
+                    )
+
+        def new_issues(pages):
+            for page in pages:
+                for issue in page:
+                    updated_date = parse_jira_datetime(issue["fields"]["updated"])
 
-                issues = get_all_issues_by_user(user["accountId"])
-                records = []
-                for issue in issues:
-                    parsed_issue = get_info_from_issue(issue)
-                    parsed_issue["assignee"] = user["accountId"]
+                    # the JQL window overlaps the previous run, skip what is already stored
+                    if (issue["id"], updated_date) in synced:
+                        continue
+                    parsed_issue = parse_issue(issue, updated_date)
                     parsed_issue["index_date"] = str(now)
-                    created_date = dateutil.parser.parse(
-                        parsed_issue["created_at"])
-                    updated_date = dateutil.parser.parse(
-                        parsed_issue["updated_at"])
-
-                    #last_day_date = now - dt2.timedelta(1)
-                    # if created_date > last_day_date or updated_date > last_day_date:
-                    #    records.append(parsed_issue)
-                    records.append(parsed_issue)
-
-                if records:
-                    db.insert_records("Issue", records)
-                print(
-                    "Inserted {} new issues for user ID: {}".format(
-                        len(records), user["accountId"]
-                    )
-                )
-            else:
-                print(
-                    "User with ID {} is of type {}. Skipping issues fetch..".format(
-                        user["accountId"], user["accountType"]
-                    )
-                )
+                    yield parsed_issue
 
+        inserted = db.upsert_issues(
+            new_issues(issue_pages()), index_date=str(now), method=write_method)
+        print("Inserted {} new issues".format(inserted))
+
+        # upsert_issues raises on rejected rows, so they are fetched again next run
+        db.set_watermark("issues", started_at)
+
+
+def load_sprints(project_id, database_name, write_method=None, state=None):
+    """
+    Stores the sprints that are not in the Sprint table yet, all in one
+    write. `state` restricts the crawl to sprints in those states, e.g.
+    "active,future".
+    """
+    from jira import iter_all_sprints, parse_jira_datetime
 
-def load_sprints(project_id, database_name):
     with TyBot(project_id, database_name) as db:
 
         query = f"""
@@ -728,32 +1240,28 @@ def load_sprints(project_id, database_name):
                 FROM
                   `{db.dataset_id}.{Config.SPRINT_TABLE}`
                 """
-        query_job = db.client.query(query)
+        sprints_already_up = {row[0] for row in db.storage.query(query)}
+
+        records = []
+        for sprint in iter_all_sprints(state=state):
+            if sprint.get("name") in sprints_already_up or not sprint.get("startDate"):
+                continue
+            end_date = parse_jira_datetime(sprint.get("endDate"))
+            parsed_sprint = {
+                "name": sprint.get("name"),
+                "start_date": str(parse_jira_datetime(sprint.get("startDate"))),
+                "end_date": str(end_date) if end_date else None,
+            }
+            print(parsed_sprint)
+            records.append(parsed_sprint)
+            # boards can hold distinct sprints with the same name, store it once
+            sprints_already_up.add(parsed_sprint["name"])
 
-        sprints_already_up = []
-        for row in query_job:
-            sprint_name = row[0]
-            sprints_already_up.append(sprint_name)
-
-        boards = get_all_boards()
-        for board in boards:
-            sprints = get_all_sprints_by_board(board["id"])
-            records = []
-            for sprint in sprints:
-                parsed_sprint = {}
-                if sprint.get("name") not in sprints_already_up and sprint.get("startDate"):
-                    parsed_sprint["name"] = sprint.get("name")
-                    parsed_sprint["start_date"] = str(dateutil.parser.parse(
-                        sprint.get("startDate")))
-                    parsed_sprint["end_date"] = str(dateutil.parser.parse(
-                        sprint.get("endDate")))
-                    print(parsed_sprint)
-                    records.append(parsed_sprint)
-
-            if records:
-                db.insert_records("Sprint", records)
-            print(
-                "Inserted {} new sprints for board: {}".format(
-                    len(records), board["id"]
-                )
-            )
+        print("Writing {} new sprints".format(len(records)))
+        db.write_records("Sprint", records, write_method)
+
+
+def refresh_weekly_performance(project_id, database_name, index_date=None, force=False):
+    """Recomputes the weekly performance tables read by the weekly reports."""
+    with TyBot(project_id, database_name) as db:
+        return db.refresh_weekly_performance(index_date, force=force)
@@ -1,12 +1,23 @@
 import os
-from typing import Optional
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from itertools import chain, islice
+from typing import Iterator, Optional
 
 import dateutil.parser
+import pytz
 import requests
 from pydash import get as s_get
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from config import Config
 
+from response_cache import ResponseCache
 from utils import print_json
 
 api_token = Config.JIRA_API_TOKEN
@@ -15,154 +26,559 @@ HEADERS = {"Accept": "application/json", "Content-Type": "application/json"}
 PARAMS = {}
 BASE_URL = "https://starkmvp.atlassian.net/rest/"
 
+# Largest page size each endpoint honours, so every round trip is as full as it can be.
+USERS_PAGE_SIZE = 1000
+SEARCH_PAGE_SIZE = 100
+AGILE_PAGE_SIZE = 50
+
+# Fallback ids of the custom fields, used when they cannot be resolved by name
+SPRINT_FIELD = "customfield_10021"
+TESTER_FIELD = "customfield_10050"
+STORY_POINTS_FIELD = Config.JIRA_STORY_POINTS_FIELD
+
+# Paths read by get_info_from_issue and parse_issue, custom fields aside. The `fields`
+# projection sent to the search endpoints is derived from them and from the
+# resolved custom fields, keep them in sync through here.
+ISSUE_PATHS = {
+    "status": "fields.status.statusCategory.name",
+    "stage": "fields.status.name",
+    "priority": "fields.priority.name",
+    "project_name": "fields.project.name",
+    "components": "fields.components",
+    "issue_summary": "fields.summary",
+    "creator": "fields.creator.accountId",
+    "reporter": "fields.reporter.accountId",
+    "assignee": "fields.assignee.accountId",
+    "created_at": "fields.created",
+    "updated_at": "fields.updated",
+    "issue_type": "fields.issuetype.name",
+}
+# the same paths as keys under `fields`, walked by parse_issue without pydash
+ISSUE_FIELD_KEYS = {column: tuple(path.split(".")[1:]) for column, path in ISSUE_PATHS.items()}
+
+
+class JiraTransport(object):
+    """
+    Keeps a pooled keep-alive session against the Jira host and retries
+    throttled or failed requests with exponential backoff and jitter,
+    honouring the server's rate-limit headers when it sends them.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, auth=AUTH, headers=None, timeout=Config.JIRA_TIMEOUT,
+                 max_retries=Config.JIRA_MAX_RETRIES,
+                 backoff_factor=Config.JIRA_BACKOFF_FACTOR,
+                 max_backoff=Config.JIRA_MAX_BACKOFF,
+                 pool_size=Config.JIRA_POOL_SIZE):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers.update(headers or HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def request(self, method: str, uri: str, headers=None, params=None, auth=None) -> requests.Response:
+        """Sends the request, retrying until it succeeds or retries run out."""
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(
+                    method, uri, headers=headers, params=params, auth=auth,
+                    timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                print(f"Jira request failed ({exc}), retrying in {delay:.1f}s...")
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = self.retry_after(response)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                print(f"Jira answered {response.status_code}, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            attempt += 1
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(response: requests.Response) -> Optional[float]:
+        """Seconds the server asked us to wait, from `Retry-After` or `X-RateLimit-Reset`."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                try:
+                    reset = parsedate_to_datetime(retry_after)
+                    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+                except (TypeError, ValueError):
+                    pass
+
+        reset = response.headers.get("X-RateLimit-Reset")
+        if reset is not None:
+            try:
+                reset_at = dateutil.parser.parse(reset)
+                if reset_at.tzinfo is None:
+                    reset_at = reset_at.replace(tzinfo=timezone.utc)
+                return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+            except (ValueError, OverflowError):
+                pass
+        return None
+
+
+# the session and the response cache are only built once Jira is called
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def jira_clients() -> tuple:
+    """The shared (JiraTransport, ResponseCache or None), created on first use."""
+    if "cache" not in _CLIENTS:
+        with _CLIENTS_LOCK:
+            if "cache" not in _CLIENTS:
+                _CLIENTS["transport"] = JiraTransport()
+                _CLIENTS["cache"] = ResponseCache.from_config()
+    return _CLIENTS["transport"], _CLIENTS["cache"]
+
 
 def call_api(uri: str, method="GET", headers=None, auth=AUTH, params=None) -> dict:
     if params is None:
         params = PARAMS
-    if headers is None:
-        headers = HEADERS
-    response = requests.request(
+    transport, response_cache = jira_clients()
+    if response_cache is not None and method == "GET":
+        return response_cache.fetch(uri, params, lambda conditional_headers: transport.request(
+            method, uri, headers={**(headers or {}), **conditional_headers},
+            params=params, auth=auth))
+    response = transport.request(
         method, uri, headers=headers, params=params, auth=auth)
     return response.json()
 
 
-def get_all_users(pprint: bool = False) -> list:
-    response = []
-    uri = BASE_URL + "api/3/users/search"
-    offset = 0
-    condition = True
-    while condition:
-        params = {"startAt": offset}
-        users = call_api(uri, params=params)
+class CustomFields(object):
+    """
+    Resolves the ids of the custom fields the parser reads by their names,
+    from the site's field metadata. The metadata is fetched once and kept
+    for `ttl` seconds. The fallback ids are used for names that are missing,
+    or for everything when resolution is disabled or the request fails.
+    """
+
+    FALLBACKS = {"story_points": STORY_POINTS_FIELD, "sprint": SPRINT_FIELD, "tester": TESTER_FIELD}
+
+    def __init__(self, ttl: int = Config.JIRA_FIELDS_TTL, enabled: bool = Config.JIRA_RESOLVE_FIELDS):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.names = {
+            "story_points": Config.JIRA_STORY_POINTS_FIELD_NAMES,
+            "sprint": [Config.JIRA_SPRINT_FIELD_NAME],
+            "tester": [Config.JIRA_TESTER_FIELD_NAME],
+        }
+        self._ids = None
+        self._resolved_at = 0.0
+
+    @property
+    def ids(self) -> dict:
+        """Custom field id of each of `story_points`, `sprint` and `tester`."""
+        if self._ids is None or time.monotonic() - self._resolved_at > self.ttl:
+            self._ids = self.resolve()
+            self._resolved_at = time.monotonic()
+        return self._ids
+
+    def resolve(self) -> dict:
+        if not self.enabled:
+            return dict(self.FALLBACKS)
+        try:
+            metadata = call_api(BASE_URL + "api/3/field")
+        except (requests.RequestException, ValueError, LookupError) as exc:
+            # LookupError covers a miss of the response cache in offline mode
+            print("Could not fetch the Jira field metadata, using the configured field ids:", exc)
+            return dict(self.FALLBACKS)
+        # error responses (401, 403, 429...) come back as a dict, not as the field list
+        if not isinstance(metadata, list):
+            print("Unexpected Jira field metadata, using the configured field ids:", metadata)
+            return dict(self.FALLBACKS)
+        return self.ids_from_metadata(metadata)
+
+    def ids_from_metadata(self, metadata: list) -> dict:
+        """Picks the id of each custom field from the list returned by api/3/field."""
+        by_name = {}
+        for field in metadata:
+            if isinstance(field, dict) and field.get("custom") and field.get("name"):
+                by_name.setdefault(field["name"].strip().lower(), []).append(field["id"])
+
+        ids = {}
+        for key, fallback in self.FALLBACKS.items():
+            ids[key] = fallback
+            matches = [by_name[name.strip().lower()] for name in self.names[key]
+                       if name.strip().lower() in by_name]
+            if not matches or any(fallback in candidates for candidates in matches):
+                continue
+            # names are in order of preference, and several fields can share
+            # a name: take the oldest field of the first name found
+            candidates = matches[0]
+            ids[key] = min(candidates, key=lambda field_id: (len(field_id), field_id))
+            if len(candidates) > 1:
+                print("Several Jira fields are named like {}: {}, using {}".format(
+                    key, sorted(candidates), ids[key]))
+        return ids
+
+
+CUSTOM_FIELDS = CustomFields()
+
+
+def iter_pages(uri: str, key: Optional[str] = None, params: Optional[dict] = None,
+               page_size: int = 50, max_workers: int = Config.JIRA_MAX_WORKERS,
+               pprint: bool = False) -> Iterator[list]:
+    """
+    Yields, in order, the items of every page of a paginated Jira endpoint.
+    The first page is read on its own; when it carries a `total`, the
+    remaining offsets are known up front and fetched in parallel through a
+    bounded thread pool, keeping at most `max_workers` pages in flight.
+    Endpoints without a total are walked serially, stopping on `isLast` or a
+    short page. `key` names the list inside each page, None means the page
+    is the list.
+    """
+    params = dict(params or {})
+
+    def fetch(offset: int):
+        page = call_api(uri, params={**params, "startAt": offset, "maxResults": page_size})
         if pprint:
-            print_json(users)
-        if users:
-            response += users
-            offset += 50
-        else:
-            condition = False
-    return response
+            print_json(page)
+        return page
 
+    def items(page) -> list:
+        if key is None:
+            return page or []
+        return page.get(key) or []
+
+    page = fetch(0)
+    page_items = items(page)
+    if not page_items:
+        return
+    yield page_items
+
+    if key is not None and page.get("total") is not None:
+        # the server may cap maxResults below what we asked for
+        step = page.get("maxResults") or len(page_items)
+        offsets = iter(range(step, page["total"], step))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque(executor.submit(fetch, offset)
+                            for offset in islice(offsets, max_workers))
+            while pending:
+                page = pending.popleft().result()
+                offset = next(offsets, None)
+                if offset is not None:
+                    pending.append(executor.submit(fetch, offset))
+                page_items = items(page)
+                if page_items:
+                    yield page_items
+        return
 
-def get_all_issues_by_user(account_id: str, pprint=False) -> list:
-    uri = BASE_URL + "api/3/search"
-    response = []
     offset = 0
     while True:
-        query = {"jql": "assignee = {}".format(account_id), "startAt": offset}
-        issues = call_api(uri, params=query)
-        if pprint:
-            print_json(issues)
-        if issues.get("issues"):
-            response += issues.get("issues")
-            offset += 50
-        else:
+        offset += len(page_items)
+        if key is not None and (page.get("isLast") or len(page_items) < (page.get("maxResults") or page_size)):
+            break
+        page = fetch(offset)
+        page_items = items(page)
+        if not page_items:
             break
-    return response
+        yield page_items
+
+
+def paginate(uri: str, key: Optional[str] = None, params: Optional[dict] = None,
+             page_size: int = 50, max_workers: int = Config.JIRA_MAX_WORKERS,
+             pprint: bool = False) -> list:
+    """Fetches every page of a paginated Jira endpoint into one list, see `iter_pages`."""
+    return list(chain.from_iterable(
+        iter_pages(uri, key, params, page_size, max_workers, pprint)))
+
+
+def jql_datetime(value: datetime) -> str:
+    """Formats a timestamp as a quoted JQL date in the Jira account's timezone."""
+    return value.astimezone(pytz.timezone(Config.JIRA_TIMEZONE)).strftime('"%Y/%m/%d %H:%M"')
+
+
+def jql_since(updated_since: datetime) -> datetime:
+    """
+    Lower bound the issue searches actually apply for `updated_since`: the
+    sync overlap subtracted and cut to the minute, as JQL reads it.
+    """
+    return jql_minute(updated_since - timedelta(minutes=Config.JIRA_SYNC_OVERLAP_MINUTES))
+
+
+def jql_minute(value: datetime) -> datetime:
+    """The minute of `value` in the Jira account's timezone, the precision of JQL dates."""
+    return value.astimezone(pytz.timezone(Config.JIRA_TIMEZONE)).replace(second=0, microsecond=0)
+
 
+def issue_fields() -> list:
+    """Jira fields the issue parser reads, to be sent as the search `fields` projection."""
+    fields = {keys[0] for keys in ISSUE_FIELD_KEYS.values()}
+    fields.update(CUSTOM_FIELDS.ids.values())
+    return sorted(fields)
 
-def get_issues_in_current_week_by_user(account_id: str, pprint=False) -> list:
+
+def search_params(jql: str, fields: Optional[list] = None, expand: Optional[list] = None) -> dict:
+    """Builds the query string of a search, projecting `fields` and `expand` when given."""
+    params = {"jql": jql}
+    if fields:
+        params["fields"] = ",".join(fields)
+    if expand:
+        params["expand"] = ",".join(expand)
+    return params
+
+
+def get_all_users(pprint: bool = False) -> list:
+    uri = BASE_URL + "api/3/users/search"
+    return paginate(uri, page_size=USERS_PAGE_SIZE, pprint=pprint)
+
+
+def iter_search(jql: str, updated_since: Optional[datetime] = None, fields: Optional[list] = None,
+                expand: Optional[list] = None, pprint=False) -> Iterator[list]:
+    """
+    Yields, page by page, the issues matching `jql` with keyset pagination:
+    each page is a new search from the `updated` minute of the last issue
+    read, ordered by updated and key. Offsets are not stable while issues
+    change under the crawl, a changed issue moves to the end and the rest
+    shift over an already read page boundary; restarting from the last
+    `updated` only returns issues again, and those are dropped here. Offsets
+    are only used to walk a minute holding more than a page of issues.
+    """
     uri = BASE_URL + "api/3/search"
-    response = []
+    if fields and "updated" not in fields:
+        fields = list(fields) + ["updated"]
+    bound = jql_since(updated_since) if updated_since is not None else None
     offset = 0
+    seen = set()
     while True:
-        query = {
-            "jql": "assignee = {} and created >= startOfWeek()".format(account_id),
-            "startAt": offset,
-        }
-        issues = call_api(uri, params=query)
+        clauses = [clause for clause in (
+            jql, bound and "updated >= {}".format(jql_datetime(bound))) if clause]
+        query = search_params(" and ".join(clauses) + " order by updated ASC, key ASC", fields, expand)
+        page = call_api(uri, params={**query, "startAt": offset, "maxResults": SEARCH_PAGE_SIZE})
         if pprint:
-            print_json(issues)
-        if issues.get("issues"):
-            response += issues.get("issues")
-            offset += 50
+            print_json(page)
+        issues = page.get("issues") or []
+        new_issues = [issue for issue in issues
+                      if (issue["id"], issue["fields"]["updated"]) not in seen]
+        seen.update((issue["id"], issue["fields"]["updated"]) for issue in new_issues)
+        if new_issues:
+            yield new_issues
+        if not issues or offset + len(issues) >= page.get("total", 0):
+            return
+        last_minute = jql_minute(parse_jira_datetime(issues[-1]["fields"]["updated"]))
+        if bound is not None and last_minute <= bound:
+            offset += len(issues)
         else:
-            break
-    return response
+            bound, offset = last_minute, 0
 
 
-def get_sp_brute_force(fields: dict, is_custom_field=False) -> Optional[int]:
-    for k, v in fields.items():
-        if isinstance(v, float) or isinstance(v, int):
-            if is_custom_field:
-                if "customfield" in k:
-                    return v
-            else:
-                return v
-    return
+def iter_all_issues_by_user(account_id: str, updated_since: Optional[datetime] = None,
+                            fields: Optional[list] = None, expand: Optional[list] = None,
+                            pprint=False) -> Iterator[list]:
+    """
+    Yields, page by page, the issues assigned to the user. When `updated_since`
+    is given only issues updated from then on are returned; JQL has minute
+    precision, so a small overlap is subtracted and callers are expected to
+    drop what they already have. `fields` and `expand` limit the payload, see
+    `issue_fields`.
+    """
+    return iter_search("assignee = {}".format(account_id), updated_since, fields, expand, pprint)
+
+
+def get_all_issues_by_user(account_id: str, updated_since: Optional[datetime] = None,
+                           fields: Optional[list] = None, expand: Optional[list] = None,
+                           pprint=False) -> list:
+    return list(chain.from_iterable(iter_all_issues_by_user(
+        account_id, updated_since, fields, expand, pprint)))
+
+
+def iter_all_issues(updated_since: Optional[datetime] = None, fields: Optional[list] = None,
+                    expand: Optional[list] = None, pprint=False) -> Iterator[list]:
+    """
+    Yields, page by page, every issue of the site from a single search ordered
+    by `updated`, whoever it is assigned to (unassigned issues included). Same
+    `updated_since` semantics as `iter_all_issues_by_user`.
+    """
+    return iter_search("", updated_since, fields, expand, pprint)
+
+
+def get_all_issues(updated_since: Optional[datetime] = None, fields: Optional[list] = None,
+                   expand: Optional[list] = None, pprint=False) -> list:
+    return list(chain.from_iterable(iter_all_issues(
+        updated_since, fields, expand, pprint)))
+
+
+def get_issues_in_current_week_by_user(account_id: str, fields: Optional[list] = None,
+                                       expand: Optional[list] = None, pprint=False) -> list:
+    uri = BASE_URL + "api/3/search"
+    query = search_params(
+        "assignee = {} and created >= startOfWeek()".format(account_id), fields, expand)
+    return paginate(uri, key="issues", params=query,
+                    page_size=SEARCH_PAGE_SIZE, pprint=pprint)
+
+
+def get_story_points(fields: dict, field_id: str) -> Optional[float]:
+    story_points = fields.get(field_id)
+    if isinstance(story_points, (int, float)) and not isinstance(story_points, bool):
+        return story_points
+    return None
 
 
 def get_info_from_issue(issue: dict) -> dict:
 
-    project_name = s_get(issue, "fields.project.name")
+    project_name = s_get(issue, ISSUE_PATHS["project_name"])
     if project_name == "Tyba":
-        project = s_get(issue, "fields.components")
+        project = s_get(issue, ISSUE_PATHS["components"])
         if len(project) > 0:
             project_name = project[0]["name"]
 
-    sprint = s_get(issue, "fields.customfield_10021")
+    custom_fields = CUSTOM_FIELDS.ids
+    sprint = s_get(issue, ["fields", custom_fields["sprint"]])
     most_recent_sprint_state = None
     most_recent_sprint_name = None
     if sprint and len(sprint) > 0:
         most_recent_sprint_state = sprint[len(sprint) - 1]["state"]
         most_recent_sprint_name = sprint[len(sprint) - 1]["name"]
 
-    tester = s_get(issue, "fields.customfield_10050")
+    tester = s_get(issue, ["fields", custom_fields["tester"]])
     tester_mail = None
     if tester:
         tester_mail = tester[0]["accountId"]
 
     return {
-        "story_points": get_sp_brute_force(
-            issue.get("fields", {}), is_custom_field=True
-        ),
-        "status": s_get(issue, "fields.status.statusCategory.name"),
-        "stage": s_get(issue, "fields.status.name"),
-        "priority": s_get(issue, "fields.priority.name"),
+        "story_points": get_story_points(issue.get("fields", {}), custom_fields["story_points"]),
+        "status": s_get(issue, ISSUE_PATHS["status"]),
+        "stage": s_get(issue, ISSUE_PATHS["stage"]),
+        "priority": s_get(issue, ISSUE_PATHS["priority"]),
         "issue_id": issue.get("id"),
         "issue_name": issue.get("key"),
         "project_name": project_name,
-        "issue_summary": s_get(issue, "fields.summary"),
-        "creator": s_get(issue, "fields.creator.accountId"),
-        "reporter": s_get(issue, "fields.reporter.accountId"),
-        "created_at": str(dateutil.parser.parse(s_get(issue, "fields.created"))),
-        "updated_at": str(dateutil.parser.parse(s_get(issue, "fields.updated"))),
-        "issue_type": s_get(issue, "fields.issuetype.name"),
+        "issue_summary": s_get(issue, ISSUE_PATHS["issue_summary"]),
+        "creator": s_get(issue, ISSUE_PATHS["creator"]),
+        "reporter": s_get(issue, ISSUE_PATHS["reporter"]),
+        "assignee": s_get(issue, ISSUE_PATHS["assignee"]),
+        "created_at": str(dateutil.parser.parse(s_get(issue, ISSUE_PATHS["created_at"]))),
+        "updated_at": str(dateutil.parser.parse(s_get(issue, ISSUE_PATHS["updated_at"]))),
+        "issue_type": s_get(issue, ISSUE_PATHS["issue_type"]),
         "tester": tester_mail,
         "sprint_status": most_recent_sprint_state,
         "sprint_name": most_recent_sprint_name}
 
 
+# Jira timestamps have a fixed layout, e.g. 2021-03-04T10:20:30.123-0500, or a
+# trailing Z on the agile endpoints. Offsets repeat a lot, so their tzinfo is cached.
+_UTC_OFFSETS = {"Z": timezone.utc}
+
+
+def _utc_offset(suffix: str) -> timezone:
+    tz = _UTC_OFFSETS.get(suffix)
+    if tz is None:
+        minutes = int(suffix[1:3]) * 60 + int(suffix[3:5])
+        tz = timezone(timedelta(minutes=-minutes if suffix[0] == "-" else minutes))
+        _UTC_OFFSETS[suffix] = tz
+    return tz
+
+
+def parse_jira_datetime(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parses a Jira timestamp by slicing its fixed layout, falling back to
+    dateutil for anything else.
+    """
+    if not value:
+        return None
+    try:
+        if value[10] == "T" and value[19] == "." and (len(value) == 28 or value[23:] == "Z"):
+            return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                            int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                            int(value[20:23]) * 1000, _utc_offset(value[23:]))
+    except (IndexError, ValueError, KeyError):
+        pass
+    return dateutil.parser.parse(value)
+
+
+def _format_jira_datetime(value: Optional[str]) -> Optional[str]:
+    parsed = parse_jira_datetime(value)
+    return str(parsed) if parsed is not None else None
+
+
+def _get_field(fields: dict, keys: tuple):
+    value = fields.get(keys[0])
+    for key in keys[1:]:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def parse_issue(issue: dict, updated_at: Optional[datetime] = None) -> dict:
+    """
+    Fast path of get_info_from_issue used by the ingestion loop, reading the
+    payload with plain dict access. Both return the same record. The
+    ingestion loop passes `updated_at` when it already parsed fields.updated.
+    """
+    fields = issue.get("fields") or {}
+    record = {column: _get_field(fields, keys) for column, keys in ISSUE_FIELD_KEYS.items()}
+
+    components = record.pop("components")
+    if record["project_name"] == "Tyba" and components:
+        record["project_name"] = components[0]["name"]
+
+    if updated_at is None:
+        updated_at = parse_jira_datetime(record["updated_at"])
+    record["created_at"] = _format_jira_datetime(record["created_at"])
+    record["updated_at"] = str(updated_at) if updated_at is not None else None
+
+    custom_fields = CUSTOM_FIELDS.ids
+    sprint = fields.get(custom_fields["sprint"])
+    tester = fields.get(custom_fields["tester"])
+    record.update({
+        "story_points": get_story_points(fields, custom_fields["story_points"]),
+        "issue_id": issue.get("id"),
+        "issue_name": issue.get("key"),
+        "tester": tester[0]["accountId"] if tester else None,
+        "sprint_status": sprint[-1]["state"] if sprint else None,
+        "sprint_name": sprint[-1]["name"] if sprint else None})
+    return record
+
+
 def get_all_boards(pprint: bool = False) -> list:
-    response = []
     uri = BASE_URL + "agile/1.0/board"
-    offset = 0
-    condition = True
-    while condition:
-        params = {"startAt": offset}
-        boards = call_api(uri, params=params)
-        if pprint:
-            print_json(boards)
-        if boards.get("values"):
-            response += boards.get("values")
-            offset += 50
-        else:
-            condition = False
-    return response
+    return paginate(uri, key="values", page_size=AGILE_PAGE_SIZE, pprint=pprint)
 
 
-def get_all_sprints_by_board(board_id: int, pprint=False) -> list:
+def get_all_sprints_by_board(board_id: int, state: Optional[str] = None, pprint=False) -> list:
     uri = BASE_URL + f"agile/1.0/board/{board_id}/sprint"
-    response = []
-    offset = 0
-    while True:
-        params = {"startAt": offset}
-        sprints = call_api(uri, params=params)
-        if pprint:
-            print_json(sprints)
-        if sprints.get("values"):
-            response += sprints.get("values")
-            offset += 50
-        else:
-            break
-    return response
+    params = {"state": state} if state else None
+    return paginate(uri, key="values", params=params, page_size=AGILE_PAGE_SIZE, pprint=pprint)
+
+
+def iter_all_sprints(state: Optional[str] = None,
+                     max_workers: int = Config.JIRA_MAX_WORKERS) -> Iterator[dict]:
+    """
+    Yields every sprint of every board once. Boards are crawled concurrently
+    and sprints shared between boards are deduplicated by id. `state` is an
+    optional comma separated filter, e.g. "active,future".
+    """
+    board_ids = [board["id"] for board in get_all_boards()]
+    seen = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sprints_by_board = executor.map(
+            lambda board_id: get_all_sprints_by_board(board_id, state), board_ids)
+        for board_id, sprints in zip(board_ids, sprints_by_board):
+            new_sprints = [sprint for sprint in sprints if sprint["id"] not in seen]
+            seen.update(sprint["id"] for sprint in new_sprints)
+            print("Found {} new sprints for board: {}".format(len(new_sprints), board_id))
+            yield from new_sprints
@@ -0,0 +1,97 @@
+import json
+from typing import Optional
+
+from slack_connect import SlackClient, SlackDeliveryQueue
+
+# Slack rejects section texts over 3000 characters and messages over 50 blocks
+MAX_SECTION_CHARS = 3000
+MAX_BLOCKS = 50
+
+
+class NotificationAggregator(object):
+    """
+    Collects the findings of every daily report per recipient, so that each
+    person gets a single Block Kit message per run instead of one message
+    per report type.
+    """
+
+    def __init__(self, greeting: str = "¡Hola! Soy yo de nuevo :smile: Este es tu resumen de hoy:"):
+        self.greeting = greeting
+        # email -> {section title -> list of issues}, in the order they were added
+        self.findings = {}
+
+    def __len__(self):
+        return len(self.findings)
+
+    def add(self, email: str, section: str, issues: list):
+        """
+        Adds issues under a section of the recipient's message. Each issue is
+        a dict with `name` and `summary`, and optionally a `priority`.
+        """
+        if not issues:
+            return
+        sections = self.findings.setdefault(email, {})
+        sections.setdefault(section, []).extend(issues)
+
+    def render(self, email: str) -> list:
+        """Builds the Block Kit blocks of the recipient's message."""
+        blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": self.greeting}}]
+        for section, issues in self.findings.get(email, {}).items():
+            blocks.append({"type": "divider"})
+            text = f"*{section}*\n"
+            for issue in issues:
+                line = f"• `{issue['name']}` - {issue['summary']}"
+                if issue.get("priority"):
+                    line += f" (Prioridad: {issue['priority']})"
+                line += "\n"
+                if len(text) + len(line) > MAX_SECTION_CHARS:
+                    blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+                    text = ""
+                text += line
+            blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": text}})
+
+        if len(blocks) > MAX_BLOCKS:
+            blocks = blocks[:MAX_BLOCKS - 1]
+            blocks.append({"type": "context", "elements": [
+                {"type": "mrkdwn", "text": "_Hay más issues pendientes, revísalos en Jira._"}]})
+        return blocks
+
+    def render_text(self, email: str) -> str:
+        """Plain text fallback used in notifications and by clients without blocks."""
+        sections = self.findings.get(email, {})
+        count = sum(len(issues) for issues in sections.values())
+        return f"{self.greeting} {count} issues por revisar."
+
+    def dump(self, path: Optional[str] = None) -> dict:
+        """Returns, and optionally writes to `path`, every message that would be sent."""
+        messages = {email: {"text": self.render_text(email), "blocks": self.render(email)}
+                    for email in self.findings}
+        if path:
+            with open(path, "w") as dump_file:
+                json.dump(messages, dump_file, ensure_ascii=False, indent=4)
+        else:
+            print(json.dumps(messages, ensure_ascii=False, indent=4))
+        return messages
+
+    def flush(self, slack_client: SlackClient, dry_run: bool = False,
+              dump_path: Optional[str] = None) -> list:
+        """
+        Sends one message per recipient through a delivery queue and clears
+        the collected findings. With `dry_run` the messages are only dumped.
+        """
+        if dry_run:
+            self.dump(dump_path)
+            self.findings = {}
+            return []
+
+        delivery_queue = SlackDeliveryQueue()
+        for email in self.findings:
+            try:
+                user = slack_client.get_user_by_email(email)
+                delivery_queue.enqueue(
+                    channel=user['id'], text=self.render_text(email), blocks=self.render(email))
+            except Exception as exc:
+                print("SlackApiError:", exc,
+                      "\nFallo en encontrar el correo: ", email)
+        self.findings = {}
+        return delivery_queue.deliver()
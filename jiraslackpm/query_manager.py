@@ -1,186 +1,155 @@
+from collections import namedtuple
+from datetime import date, datetime, timezone
+from os import path
+from typing import Optional
+
+from google.cloud.bigquery import QueryJobConfig, ScalarQueryParameter
 from config import Config
 
 DATASET_ID = "{}.{}".format(Config.BQ_PROJECT,Config.BQ_DATABASE)
 
-def warning_issues_dev():
-    query = f"""
-        SELECT
-            issue.issue_name,
-            issue.issue_summary,
-            user.email,
-            processed.days_in_DEV,
-            sprint.start_date,
-            sprint.end_date,
-            FROM (
-            SELECT
-                issue.issue_name,
-                sprint.name,
-                TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), MIN(updated_at), DAY) AS days_in_DEV,
-                MAX(updated_at) AS last_update
-            FROM
-                `{DATASET_ID}.Issue` AS issue,
-                `{DATASET_ID}.{Config.SPRINT_TABLE}` AS sprint
-            WHERE
-                issue.sprint_name = sprint.name
-                AND sprint.start_date <= CURRENT_TIMESTAMP()
-                AND sprint.end_date >= CURRENT_TIMESTAMP()
-                AND issue.stage = "ENV: DEV"
-                AND issue.issue_type != "Error"
-                AND issue.issue_type != "Bug"
-                AND issue.issue_name IN (
-                SELECT
-                issue.issue_name
-                FROM (
-                SELECT
-                    issue_id,
-                    issue_name,
-                    MAX(updated_at) AS last_update
-                FROM
-                    `{DATASET_ID}.Issue`
-                GROUP BY
-                    issue_id,
-                    issue_name) AS issues_last_updated,
-                `{DATASET_ID}.Issue` AS issue
-                WHERE
-                issue.issue_id = issues_last_updated.issue_id
-                AND issue.updated_at = issues_last_updated.last_update
-                AND issue.sprint_status = "active"
-                AND issue.sprint_name IS NOT NULL
-                AND issue.stage = "ENV: DEV")
-            GROUP BY
-                issue.issue_name,
-                sprint.name) AS processed,
-            `{DATASET_ID}.Issue` AS issue,
-            `{DATASET_ID}.User` AS user,
-            `{DATASET_ID}.{Config.SPRINT_TABLE}` AS sprint
-            WHERE
-            issue.issue_name = processed.issue_name
-            AND processed.last_update = issue.updated_at
-            AND issue.assignee = user.account_id
-            AND issue.sprint_name = sprint.name
-            AND processed.days_in_DEV > 3
-        """
-
-    return query
-
-def warning_issues_qa():
-    query = f"""
-    SELECT
-        issue.issue_name,
-        issue.issue_summary,
-        user.email,
-        processed.days_in_QA,
-        sprint.start_date,
-        sprint.end_date,
-        FROM (
-        SELECT
+# Report queries are fixed texts plus named parameters. Identical texts are
+# served from BigQuery's query cache, and values never end up inside the SQL.
+ReportQuery = namedtuple("ReportQuery", ["sql", "job_config"])
+
+# checked in order, bool before int and datetime before date
+PARAMETER_TYPES = ((bool, "BOOL"), (int, "INT64"), (float, "FLOAT64"), (str, "STRING"),
+                   (datetime, "TIMESTAMP"), (date, "DATE"))
+
+
+def query_parameter(name: str, value, type_: Optional[str] = None) -> ScalarQueryParameter:
+    if type_ is None:
+        type_ = next((bq_type for py_type, bq_type in PARAMETER_TYPES
+                      if isinstance(value, py_type)), "STRING")
+    return ScalarQueryParameter(name, type_, value)
+
+
+def report_query(sql: str, **parameters) -> ReportQuery:
+    """
+    Binds the keyword arguments as the @parameters of the query. A value
+    can be given as a (type, value) pair, e.g. to pass a typed NULL.
+    """
+    query_parameters = [
+        query_parameter(name, *reversed(value)) if isinstance(value, tuple)
+        else query_parameter(name, value)
+        for name, value in parameters.items()
+    ]
+    return ReportQuery(sql, QueryJobConfig(query_parameters=query_parameters))
+
+
+def report_as_of(now: Optional[datetime] = None) -> datetime:
+    """
+    The current UTC time truncated to the hour, bound as @as_of instead of
+    CURRENT_TIMESTAMP() so that reruns within the hour hit the query cache.
+    """
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+# -------------------------
+# Issues stuck in a stage
+# -------------------------
+# Stage, minimum days in it, and whether QA issues belong to their tester.
+WARNING_STAGES = {
+    "dev": {"stage": "ENV: DEV", "min_days": 4, "owner_is_tester": False},
+    "qa": {"stage": "ENV: QA", "min_days": 4, "owner_is_tester": True},
+    "ready_dev": {"stage": "Ready for Dev", "min_days": 7, "owner_is_tester": False},
+}
+
+
+def stage_issues_cte(dataset_id: str) -> str:
+    """
+    Latest state of the issues of the active sprint that are in @stage,
+    read from the current-state table. Shared by the warning reports.
+    """
+    return f"""
+        stage_issues AS (
+          SELECT
+            issue.issue_name
+          FROM
+            `{dataset_id}.{Config.ISSUE_CURRENT_TABLE}` AS issue
+          WHERE
+            issue.sprint_status = "active"
+            AND issue.sprint_name IS NOT NULL
+            AND LOWER(issue.stage) = LOWER(@stage))"""
+
+
+def warning_issues_sql(dataset_id: str = DATASET_ID) -> str:
+    return f"""
+    WITH
+    {stage_issues_cte(dataset_id)},
+        processed AS (
+          SELECT
             issue.issue_name,
             sprint.name,
-            TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), MIN(updated_at), DAY) AS days_in_QA,
+            TIMESTAMP_DIFF(@as_of, MIN(updated_at), DAY) AS days_in_stage,
             MAX(updated_at) AS last_update
-        FROM
-            `{DATASET_ID}.Issue` AS issue,
-            `{DATASET_ID}.{Config.SPRINT_TABLE}` AS sprint
-        WHERE
+          FROM
+            `{dataset_id}.Issue` AS issue,
+            `{dataset_id}.{Config.SPRINT_TABLE}` AS sprint
+          WHERE
             issue.sprint_name = sprint.name
-            AND sprint.start_date <= CURRENT_TIMESTAMP()
-            AND sprint.end_date >= CURRENT_TIMESTAMP()
-            AND issue.stage = "ENV: QA"
+            AND sprint.start_date <= @as_of
+            AND sprint.end_date >= @as_of
+            AND LOWER(issue.stage) = LOWER(@stage)
             AND issue.issue_type != "Error"
             AND issue.issue_type != "Bug"
-            AND issue.issue_name IN (
-            SELECT
-            issue.issue_name
-            FROM (
-            SELECT
-                issue_id,
-                issue_name,
-                MAX(updated_at) AS last_update
-            FROM
-                `{DATASET_ID}.Issue`
-            GROUP BY
-                issue_id,
-                issue_name) AS issues_last_updated,
-            `{DATASET_ID}.Issue` AS issue
-            WHERE
-            issue.issue_id = issues_last_updated.issue_id
-            AND issue.updated_at = issues_last_updated.last_update
-            AND issue.sprint_status = "active"
-            AND issue.sprint_name IS NOT NULL
-            AND issue.stage = "ENV: QA")
-        GROUP BY
+            AND issue.issue_name IN (SELECT issue_name FROM stage_issues)
+          GROUP BY
             issue.issue_name,
-            sprint.name) AS processed,
-        `{DATASET_ID}.Issue` AS issue,
-        `{DATASET_ID}.User` AS user,
-        `{DATASET_ID}.{Config.SPRINT_TABLE}` AS sprint
-        WHERE
-        issue.issue_name = processed.issue_name
-        AND processed.last_update = issue.updated_at
-        AND (CASE WHEN issue.tester IS NULL THEN issue.assignee ELSE issue.tester END) = user.account_id
-        AND issue.sprint_name = sprint.name
-        AND processed.days_in_QA > 3
-    """
-    
-    return query
-
-def warning_issues_ready_dev():
-    query=f"""
+            sprint.name)
     SELECT
         issue.issue_name,
         issue.issue_summary,
         user.email,
-        processed.days_in_ready_DEV,
+        processed.days_in_stage,
         sprint.start_date,
-        sprint.end_date,
-        FROM (
-        SELECT
-            issue.issue_name,
-            sprint.name,
-            TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), MIN(updated_at), DAY) AS days_in_ready_DEV,
-            MAX(updated_at) AS last_update
-        FROM
-            `{DATASET_ID}.Issue` AS issue,
-            `{DATASET_ID}.{Config.SPRINT_TABLE}` AS sprint
-        WHERE
-            issue.sprint_name = sprint.name
-            AND sprint.start_date <= CURRENT_TIMESTAMP()
-            AND sprint.end_date >= CURRENT_TIMESTAMP()
-            AND LOWER(issue.stage) = "ready for dev"
-            AND issue.issue_type != "Error"
-            AND issue.issue_type != "Bug"
-            AND issue.issue_name IN (
-            SELECT
-            issue.issue_name
-            FROM (
-            SELECT
-                issue_id,
-                issue_name,
-                MAX(updated_at) AS last_update
-            FROM
-                `{DATASET_ID}.Issue`
-            GROUP BY
-                issue_id,
-                issue_name) AS issues_last_updated,
-            `{DATASET_ID}.Issue` AS issue
-            WHERE
-            issue.issue_id = issues_last_updated.issue_id
-            AND issue.updated_at = issues_last_updated.last_update
-            AND issue.sprint_status = "active"
-            AND issue.sprint_name IS NOT NULL
-            AND LOWER(issue.stage) = "ready for dev")
-        GROUP BY
-            issue.issue_name,
-            sprint.name) AS processed,
-        `{DATASET_ID}.Issue` AS issue,
-        `{DATASET_ID}.User` AS user,
-        `{DATASET_ID}.{Config.SPRINT_TABLE}` AS sprint
-        WHERE
+        sprint.end_date
+    FROM
+        processed,
+        `{dataset_id}.{Config.ISSUE_CURRENT_TABLE}` AS issue,
+        `{dataset_id}.User` AS user,
+        `{dataset_id}.{Config.SPRINT_TABLE}` AS sprint
+    WHERE
         issue.issue_name = processed.issue_name
         AND processed.last_update = issue.updated_at
-        AND issue.assignee = user.account_id
+        AND (CASE WHEN @owner_is_tester AND issue.tester IS NOT NULL
+             THEN issue.tester ELSE issue.assignee END) = user.account_id
+        AND user.email IS NOT NULL
         AND issue.sprint_name = sprint.name
-        AND processed.days_in_ready_DEV >= 7
-  """
+        AND processed.days_in_stage >= @min_days
+    """
+
+
+def warning_issues(stage: str, dataset_id: str = DATASET_ID,
+                   as_of: Optional[datetime] = None) -> ReportQuery:
+    """
+    Issues of the active sprint stuck in one of the WARNING_STAGES, with
+    their owner, as of `as_of` (the current hour by default).
+    """
+    return report_query(warning_issues_sql(dataset_id), **WARNING_STAGES[stage],
+                        as_of=as_of or report_as_of())
+
+
+def warning_issues_dev(dataset_id: str = DATASET_ID, as_of: Optional[datetime] = None) -> ReportQuery:
+    return warning_issues("dev", dataset_id, as_of)
 
-    return query
\ No newline at end of file
+
+def warning_issues_qa(dataset_id: str = DATASET_ID, as_of: Optional[datetime] = None) -> ReportQuery:
+    return warning_issues("qa", dataset_id, as_of)
+
+
+def warning_issues_ready_dev(dataset_id: str = DATASET_ID, as_of: Optional[datetime] = None) -> ReportQuery:
+    return warning_issues("ready_dev", dataset_id, as_of)
+
+
+# -------------------------
+# Saved queries
+# -------------------------
+def saved_query(name: str, dataset_id: str = DATASET_ID) -> str:
+    """
+    Text of one of the queries kept in QUERIES_DIR, e.g. "metrics x week x
+    squad", with its `{dataset}` placeholder pointed at the dataset.
+    """
+    with open(path.join(Config.QUERIES_DIR, name + ".txt")) as query_file:
+        return query_file.read().replace("{dataset}", dataset_id)
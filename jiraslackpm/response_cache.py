@@ -0,0 +1,179 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from config import Config
+
+# Seconds a response stays fresh, by the first regular expression that
+# matches the URL path. Stale responses are revalidated with If-None-Match /
+# If-Modified-Since. Responses with a 0 TTL are only stored when recording
+# for offline replays, otherwise they would evict the reusable ones.
+DEFAULT_TTLS = {
+    r"agile/1\.0/board/\d+/sprint$": 3600,
+    r"agile/1\.0/board$": 86400,
+    r"api/3/field$": 86400,
+    r"api/3/users/search$": 86400,
+    r"api/3/search$": 0,
+}
+
+
+class ResponseCacheMiss(LookupError):
+    """Raised in offline mode for a request that was never cached."""
+
+
+def parse_ttls(spec: Optional[str]) -> dict:
+    """Parses `pattern=seconds,...` overrides, which are tried before the default TTLs."""
+    ttls = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            pattern, seconds = item.rsplit("=", 1)
+            ttls[pattern.strip()] = int(seconds)
+    for pattern, seconds in DEFAULT_TTLS.items():
+        ttls.setdefault(pattern, seconds)
+    return ttls
+
+
+class ResponseCache(object):
+    """
+    SQLite store of raw Jira GET responses keyed by URL and params. Fresh
+    entries are served without a round trip, stale ones are revalidated,
+    and the least recently used entries are evicted past `max_bytes`. In
+    `offline` mode only cached responses are replayed and Jira is never
+    called; with `record` the 0 TTL responses are kept for those replays.
+    """
+
+    def __init__(self, path: str, max_bytes: int = Config.JIRA_CACHE_MAX_MB * 1024 * 1024,
+                 ttls: Optional[dict] = None, offline: bool = Config.JIRA_CACHE_OFFLINE,
+                 record: bool = Config.JIRA_CACHE_RECORD):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls if ttls is not None else parse_ttls(Config.JIRA_CACHE_TTLS)
+        self.offline = offline
+        self.record = record
+        # pages are fetched from several threads, they share one connection
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    uri TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )
+                """)
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        # running size of the stored bodies, so puts don't scan the table
+        self.total_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @classmethod
+    def from_config(cls) -> Optional["ResponseCache"]:
+        """The cache configured through JIRA_CACHE_PATH, None when it is unset."""
+        if not Config.JIRA_CACHE_PATH:
+            return None
+        return cls(Config.JIRA_CACHE_PATH)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @staticmethod
+    def key(uri: str, params: Optional[dict] = None) -> str:
+        payload = json.dumps([uri, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def ttl(self, uri: str) -> int:
+        path = urlsplit(uri).path.rstrip("/")
+        for pattern, seconds in self.ttls.items():
+            if re.search(pattern, path):
+                return seconds
+        return 0
+
+    def get(self, key: str) -> Optional[tuple]:
+        """(body, etag, last_modified, stored_at) of a cached response, marking it as used."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses WHERE key = ?",
+                (key,)).fetchone()
+            if row is not None:
+                with self.connection:
+                    self.connection.execute(
+                        "UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row
+
+    def put(self, key: str, uri: str, body: bytes, etag: Optional[str] = None,
+            last_modified: Optional[str] = None):
+        now = time.time()
+        with self.lock, self.connection:
+            replaced = self.connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, uri, body, etag, last_modified, now, now, len(body)))
+            self.total_bytes += len(body) - (replaced[0] if replaced else 0)
+            self.evict()
+
+    def touch(self, key: str):
+        """Marks a revalidated response as fresh again."""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def evict(self):
+        """Drops the least recently used responses until the cache fits in `max_bytes`."""
+        if self.total_bytes <= self.max_bytes:
+            return
+        rows = self.connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at")
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def fetch(self, uri: str, params: Optional[dict],
+              send: Callable[[dict], requests.Response]):
+        """
+        Decoded JSON body of a GET, from the cache when possible. `send`
+        performs the request with the extra (conditional) headers it is given.
+        """
+        key = self.key(uri, params)
+        entry = self.get(key)
+        if entry is not None:
+            body, etag, last_modified, stored_at = entry
+            if self.offline or time.time() - stored_at < self.ttl(uri):
+                return json.loads(body)
+        elif self.offline:
+            raise ResponseCacheMiss(f"{uri} {params} is not cached and the cache is offline")
+
+        conditional_headers = {}
+        if entry is not None:
+            if etag:
+                conditional_headers["If-None-Match"] = etag
+            if last_modified:
+                conditional_headers["If-Modified-Since"] = last_modified
+
+        response = send(conditional_headers)
+        if response.status_code == 304 and entry is not None:
+            self.touch(key)
+            return json.loads(entry[0])
+        if response.status_code == 200 and (self.record or self.ttl(uri) > 0):
+            self.put(key, uri, response.content, response.headers.get("ETag"),
+                     response.headers.get("Last-Modified"))
+        return response.json()
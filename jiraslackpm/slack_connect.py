@@ -1,13 +1,70 @@
+import asyncio
+import json
 import os
+import threading
+import time
+from collections import namedtuple
+from typing import Optional
 
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from slack_sdk.web import SlackResponse
 from config import Config
 
+
+class SlackUserCache(object):
+    """
+    Email -> Slack user cache with a TTL, optionally persisted to a JSON file
+    so that successive runs skip the rate-limited users.lookupByEmail calls.
+    """
+
+    def __init__(self, ttl: int = Config.SLACK_USER_CACHE_TTL,
+                 path: Optional[str] = Config.SLACK_USER_CACHE_PATH):
+        self.ttl = ttl
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as cache_file:
+                self.entries = json.load(cache_file)
+
+    def get(self, email: Optional[str]) -> Optional[dict]:
+        # accounts missing from the users export have no email
+        if not email:
+            return None
+        entry = self.entries.get(email.lower())
+        if entry and entry["expires_at"] > time.time():
+            return entry["user"]
+
+    def put(self, email: Optional[str], user: dict):
+        if not email:
+            return
+        with self.lock:
+            self.entries[email.lower()] = {
+                "user": {"id": user["id"], "name": user.get("name")},
+                "expires_at": time.time() + self.ttl,
+            }
+
+    def save(self):
+        """Writes the cache file, if any, dropping expired entries."""
+        if not self.path:
+            return
+        with self.lock:
+            now = time.time()
+            entries = {email: entry for email, entry in self.entries.items()
+                       if entry["expires_at"] > now}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(tmp_path, self.path)
+
+
 class SlackClient(object):
-    def __init__(self, token=None):
+    def __init__(self, token=None, user_cache: Optional[SlackUserCache] = None):
         self.client = WebClient(token=token or Config.SLACK_OAUTH_ACCESS_TOKEN)
+        self.user_cache = user_cache if user_cache is not None else SlackUserCache()
+        self.user_cache_warmed = False
+
     def post_message_to_channel(self, channel: str, message: str):
         try:
             response = self.client.chat_postMessage(channel=channel, text=message)
@@ -28,7 +85,145 @@ class SlackClient(object):
         if response.data.get('ok'):
             return response.get('channel')
 
-    def get_user_by_email(self, email: str) -> SlackResponse:
+    def warm_user_cache(self):
+        """Fills the user cache with every workspace member through paginated users.list calls."""
+        for page in self.client.users_list(limit=200):
+            for member in page.get('members', []):
+                email = member.get('profile', {}).get('email')
+                if email and not member.get('deleted'):
+                    self.user_cache.put(email, member)
+        self.user_cache_warmed = True
+        self.user_cache.save()
+
+    def get_user_by_email(self, email: Optional[str]) -> SlackResponse:
+        if not email:
+            return None
+        user = self.user_cache.get(email)
+        if user is not None:
+            return user
+        if Config.SLACK_USER_CACHE_WARM and not self.user_cache_warmed:
+            self.warm_user_cache()
+            user = self.user_cache.get(email)
+            if user is not None:
+                return user
+
         user = self.client.api_call(api_method='users.lookupByEmail', params={"email": email})
         if user.data.get('ok'):
+            self.user_cache.put(email, user.data.get('user'))
+            self.user_cache.save()
             return user.data.get('user')
+
+
+# Requests per second and burst size allowed for each Web API method, after
+# Slack's rate limit tiers. chat.postMessage is limited to about one message
+# per second per channel on top of a workspace wide budget.
+SLACK_METHOD_RATES = {
+    "chat.postMessage": (300 / 60, 10),
+}
+SLACK_CHANNEL_RATE = (1, 1)
+
+DeliveryResult = namedtuple("DeliveryResult", ["channel", "ok", "error", "ts"])
+
+
+class TokenBucket(object):
+    """Asyncio token bucket that can also be paused for a server imposed Retry-After."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class SlackDeliveryQueue(object):
+    """
+    Outbound Slack messages sent concurrently with slack_sdk's AsyncWebClient.
+    Sends are throttled by per-method token buckets matching Slack's tiers,
+    back off on 429 for the Retry-After the server asks for and keep at most
+    `max_in_flight` requests open. `deliver` reports the outcome of every
+    message instead of dropping failures.
+    """
+
+    def __init__(self, token=None, max_in_flight: int = Config.SLACK_MAX_IN_FLIGHT,
+                 max_attempts: int = Config.SLACK_MAX_ATTEMPTS):
+        self.token = token or Config.SLACK_OAUTH_ACCESS_TOKEN
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.messages = []
+
+    def __len__(self):
+        return len(self.messages)
+
+    def enqueue(self, channel: str, text: Optional[str] = None, blocks: Optional[list] = None):
+        self.messages.append({"channel": channel, "text": text, "blocks": blocks})
+
+    def deliver(self) -> list:
+        """Sends every queued message and returns a DeliveryResult per message."""
+        if not self.messages:
+            return []
+        messages, self.messages = self.messages, []
+        results = asyncio.run(self._deliver(messages))
+        failed = [result for result in results if not result.ok]
+        print(f"Delivered {len(results) - len(failed)}/{len(results)} Slack messages")
+        for result in failed:
+            print(f"Failed to deliver to {result.channel}: {result.error}")
+        return results
+
+    async def _deliver(self, messages: list) -> list:
+        # imported here so aiohttp is only needed when the queue is used
+        from slack_sdk.web.async_client import AsyncWebClient
+
+        client = AsyncWebClient(token=self.token)
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        method_bucket = TokenBucket(*SLACK_METHOD_RATES["chat.postMessage"])
+        channel_buckets = {}
+
+        async def send(message: dict) -> DeliveryResult:
+            channel = message["channel"]
+            channel_bucket = channel_buckets.setdefault(channel, TokenBucket(*SLACK_CHANNEL_RATE))
+            error = None
+            for attempt in range(self.max_attempts):
+                await channel_bucket.acquire()
+                await method_bucket.acquire()
+                backoff = 0
+                async with semaphore:
+                    try:
+                        response = await client.chat_postMessage(
+                            channel=channel, text=message["text"], blocks=message["blocks"])
+                        return DeliveryResult(channel, True, None, response.get("ts"))
+                    except SlackApiError as e:
+                        error = e.response.get("error")
+                        if e.response.status_code != 429:
+                            break
+                        retry_after = float(e.response.headers.get("Retry-After", 1))
+                        method_bucket.pause(retry_after)
+                        channel_bucket.pause(retry_after)
+                    except Exception as exc:
+                        error = str(exc)
+                        backoff = 2 ** attempt
+                # back off without holding an in-flight slot
+                if backoff and attempt + 1 < self.max_attempts:
+                    await asyncio.sleep(backoff)
+            return DeliveryResult(channel, False, error, None)
+
+        return await asyncio.gather(*(send(message) for message in messages))
@@ -0,0 +1,572 @@
+"""Storage backends TyBot keeps its tables and runs its queries on."""
+import io
+import json
+import re
+import tempfile
+from typing import Iterable, Optional
+
+from google.api_core.exceptions import Conflict, NotFound
+import google.cloud.bigquery as bigquery
+from config import Config
+
+
+class StorageBackend(object):
+    """
+    Table management, writes and queries TyBot needs from a warehouse.
+    Tables are described with `bigquery.SchemaField` lists whatever the
+    backend, and `query` returns a job whose rows can be iterated, directly
+    or through `result()`, and read by position or by column name.
+    """
+
+    dataset_id = None
+
+    def query(self, sql: str, job_config=None):
+        raise NotImplementedError
+
+    def table_exists(self, table_name: str) -> bool:
+        raise NotImplementedError
+
+    def table_schema(self, table_name: str) -> list:
+        raise NotImplementedError
+
+    def create_table(self, table_name: str, schema: list, partition_field: Optional[str] = None,
+                     clustering_fields: Optional[list] = None):
+        """
+        Creates the table unless it exists. It can be partitioned by day on a
+        TIMESTAMP/DATE column and clustered by up to four columns.
+        """
+        raise NotImplementedError
+
+    def delete_table(self, table_name: str) -> bool:
+        """Drops the table, returns False if it did not exist."""
+        raise NotImplementedError
+
+    def insert_rows(self, table_name: str, rows: list) -> list:
+        """Streams a batch of rows into the table, returns the errors found."""
+        raise NotImplementedError
+
+    def load_rows(self, table_name: str, records: Iterable, schema: Optional[list] = None,
+                  truncate: bool = False, staging: Optional[str] = None) -> int:
+        """Writes the records in one bulk operation, returns the rows written."""
+        raise NotImplementedError
+
+    def relax_columns(self, table_name: str, columns: list):
+        """Turns the REQUIRED columns given as parameter into NULLABLE ones."""
+        raise NotImplementedError
+
+    def migrate_table_layout(self, table_name: str, partition_field: str, clustering_fields: list):
+        """Moves an existing table to the given partitioning and clustering, when supported."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class BigQueryBackend(StorageBackend):
+    """Tables of a BigQuery dataset, created on first use."""
+
+    def __init__(self, project_id, db_name):
+        self.project_id = project_id
+        self.db_name = db_name
+        self._client = None
+        self._dataset = None
+
+    @property
+    def client(self):
+        # resolving the default credentials can take a round trip, do it on first use
+        if self._client is None:
+            self._client = bigquery.Client(project=self.project_id)
+        return self._client
+
+    @property
+    def dataset_id(self) -> str:
+        return "{}.{}".format(self.project_id or self.client.project, self.db_name)
+
+    @property
+    def dataset(self):
+        return self.ensure_dataset()
+
+    def ensure_dataset(self):
+        """Creates the dataset if needed, the first time a table is written."""
+        if self._dataset is None:
+            try:
+                dataset = bigquery.Dataset(self.dataset_id)
+                self._dataset = self.client.create_dataset(
+                    dataset, timeout=30
+                )  # Make an API request.
+            except Conflict:
+                self._dataset = self.client.get_dataset(self.dataset_id)
+        return self._dataset
+
+    def table_id(self, table_name: str) -> str:
+        return "{}.{}".format(self.dataset_id, table_name)
+
+    def query(self, sql: str, job_config=None):
+        return self.client.query(sql, job_config=job_config)
+
+    def table_exists(self, table_name: str) -> bool:
+        try:
+            self.client.get_table(self.table_id(table_name))
+            return True
+        except NotFound:
+            return False
+
+    def table_schema(self, table_name: str) -> list:
+        return self.client.get_table(self.table_id(table_name)).schema
+
+    def create_table(self, table_name: str, schema: list, partition_field: Optional[str] = None,
+                     clustering_fields: Optional[list] = None):
+        table_id = self.table_id(table_name)
+        self.ensure_dataset()
+        try:
+            table = bigquery.Table(table_id, schema=schema)
+            if partition_field:
+                table.time_partitioning = bigquery.TimePartitioning(
+                    type_=bigquery.TimePartitioningType.DAY, field=partition_field)
+            if clustering_fields:
+                table.clustering_fields = clustering_fields
+            table = self.client.create_table(table)
+        except Conflict:
+            table = self.client.get_table(table_id)
+        return table
+
+    def delete_table(self, table_name: str) -> bool:
+        try:
+            self.client.delete_table(self.table_id(table_name))
+            return True
+        except NotFound:
+            return False
+
+    def insert_rows(self, table_name: str, rows: list) -> list:
+        return self.client.insert_rows_json(self.table_id(table_name), rows)
+
+    def load_rows(self, table_name: str, records: Iterable, schema: Optional[list] = None,
+                  truncate: bool = False, staging: Optional[str] = None) -> int:
+        """
+        Stages the records as newline delimited JSON, in a temporary file or
+        in memory (`staging` "file" or "memory"), and submits a single load
+        job. Unlike streaming inserts, loaded rows are not billed per row and
+        can be updated or deleted right away. The table's own schema is used
+        unless `schema` is given.
+        """
+        table_id = self.table_id(table_name)
+        if schema is None:
+            schema = self.client.get_table(table_id).schema
+        else:
+            # load jobs create missing tables, but not their dataset
+            self.ensure_dataset()
+        staging = staging or Config.BQ_LOAD_STAGING
+
+        with (io.BytesIO() if staging == "memory" else tempfile.TemporaryFile()) as staged:
+            rows = 0
+            for record in records:
+                staged.write(json.dumps(record, default=str).encode("utf-8"))
+                staged.write(b"\n")
+                rows += 1
+            if not rows:
+                return 0
+
+            job_config = bigquery.LoadJobConfig(
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                schema=schema,
+                write_disposition=(bigquery.WriteDisposition.WRITE_TRUNCATE if truncate
+                                   else bigquery.WriteDisposition.WRITE_APPEND),
+            )
+            job = self.client.load_table_from_file(
+                staged, table_id, rewind=True, job_config=job_config)
+            try:
+                job.result()
+            except Exception as exc:
+                print("Encountered errors while loading rows: {}".format(job.errors or exc))
+                raise
+        return rows
+
+    def relax_columns(self, table_name: str, columns: list):
+        table = self.client.get_table(self.table_id(table_name))
+        schema = []
+        changed = False
+        for field in table.schema:
+            if field.name in columns and field.mode == "REQUIRED":
+                field = bigquery.SchemaField(
+                    field.name, field.field_type, mode="NULLABLE",
+                    description=field.description)
+                changed = True
+            schema.append(field)
+        if changed:
+            table.schema = schema
+            self.client.update_table(table, ["schema"])
+
+    def migrate_table_layout(self, table_name: str, partition_field: str, clustering_fields: list):
+        """
+        Rewrites an existing table into a partitioned and clustered copy and
+        swaps it in under the same name. The swap is not atomic, run it while
+        no sync is writing into the table.
+        """
+        table_id = self.table_id(table_name)
+        table = self.client.get_table(table_id)
+        partitioning = table.time_partitioning
+        if (partitioning is not None and partitioning.field == partition_field
+                and table.clustering_fields == clustering_fields):
+            print("Table {} already has the requested layout".format(table_name))
+            return table
+
+        migrated_name = "{}_migrated".format(table_name)
+        migrated_id = self.table_id(migrated_name)
+        self.delete_table(migrated_name)
+        self.create_table(migrated_name, table.schema,
+                          partition_field, clustering_fields)
+        columns = ", ".join(field.name for field in table.schema)
+        query = f"""
+                INSERT INTO `{migrated_id}` ({columns})
+                SELECT {columns} FROM `{table_id}`
+                """
+        self.client.query(query).result()
+
+        print("Swapping {} for its partitioned copy...".format(table_name))
+        self.client.delete_table(table_id)
+        self.client.copy_table(migrated_id, table_id).result()
+        self.client.delete_table(migrated_id)
+        return self.client.get_table(table_id)
+
+    def close(self):
+        self._client = None
+        self._dataset = None
+
+
+# -------------------------
+# DuckDB
+# -------------------------
+DUCKDB_TYPES = {
+    "STRING": "VARCHAR",
+    "NUMERIC": "DECIMAL(38, 9)",
+    "BIGNUMERIC": "DOUBLE",
+    "FLOAT": "DOUBLE",
+    "FLOAT64": "DOUBLE",
+    "INTEGER": "BIGINT",
+    "INT64": "BIGINT",
+    "BOOL": "BOOLEAN",
+    "BOOLEAN": "BOOLEAN",
+    "TIMESTAMP": "TIMESTAMPTZ",
+    "DATETIME": "TIMESTAMP",
+    "DATE": "DATE",
+}
+BIGQUERY_TYPES = {
+    "VARCHAR": "STRING",
+    "DOUBLE": "FLOAT",
+    "BIGINT": "INTEGER",
+    "INTEGER": "INTEGER",
+    "BOOLEAN": "BOOL",
+    "TIMESTAMP WITH TIME ZONE": "TIMESTAMP",
+    "TIMESTAMP": "DATETIME",
+    "DATE": "DATE",
+}
+
+# string literals and quoted identifiers, matched before anything is rewritten
+_QUOTED = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`")
+_LITERAL = "\x00{}\x00"
+_LITERAL_REF = re.compile(r"\x00(\d+)\x00")
+_UTC_OFFSET = re.compile(r"^UTC([+-])(\d{1,2})(?::(\d{2}))?$")
+_DIFF_FUNCTIONS = re.compile(r"\b(TIMESTAMP_DIFF|DATE_DIFF|DATETIME_DIFF)\s*\(", re.IGNORECASE)
+_CAST_FUNCTIONS = re.compile(r"(?<![\w.])(TIMESTAMP|DATE|DATETIME)\s*\(", re.IGNORECASE)
+_TABLE_OPTIONS = re.compile(r"\b(PARTITION\s+BY|CLUSTER\s+BY|OPTIONS)\b", re.IGNORECASE)
+_TABLE_OPTIONS_END = re.compile(r"\b(PARTITION\s+BY|CLUSTER\s+BY|OPTIONS|AS)\b|;", re.IGNORECASE)
+
+
+def _closing_paren(sql: str, start: int) -> int:
+    """Index of the parenthesis closing the one opened right before `start`."""
+    depth = 1
+    for index in range(start, len(sql)):
+        if sql[index] == "(":
+            depth += 1
+        elif sql[index] == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    raise ValueError("Unbalanced parentheses in query")
+
+
+def _split_arguments(arguments: str) -> list:
+    parts, depth, start = [], 0, 0
+    for index, char in enumerate(arguments):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(arguments[start:index].strip())
+            start = index + 1
+    parts.append(arguments[start:].strip())
+    return parts
+
+
+def _rewrite_calls(sql: str, pattern, rewrite) -> str:
+    """Replaces every call matched by `pattern` with `rewrite(name, arguments)`."""
+    match = pattern.search(sql)
+    while match:
+        end = _closing_paren(sql, match.end())
+        replacement = rewrite(match.group(1).upper(), _split_arguments(sql[match.end():end]))
+        sql = sql[:match.start()] + replacement + sql[end + 1:]
+        match = pattern.search(sql, match.start() + len(replacement))
+    return sql
+
+
+def _depth_at(sql: str, index: int) -> int:
+    return sql.count("(", 0, index) - sql.count(")", 0, index)
+
+
+def _strip_table_options(sql: str) -> str:
+    """Drops the PARTITION BY, CLUSTER BY and OPTIONS clauses of CREATE TABLE statements."""
+    if not re.match(r"\s*CREATE\b", sql, re.IGNORECASE):
+        return sql
+    position = 0
+    while True:
+        match = _TABLE_OPTIONS.search(sql, position)
+        if not match:
+            return sql
+        if _depth_at(sql, match.start()) != 0:
+            position = match.end()
+            continue
+        end = match.end()
+        while True:
+            following = _TABLE_OPTIONS_END.search(sql, end)
+            if following is None:
+                end = len(sql)
+                break
+            if _depth_at(sql, following.start()) == 0:
+                end = following.start()
+                break
+            end = following.end()
+        sql = sql[:match.start()] + sql[end:]
+        position = match.start()
+
+
+def translate_sql(sql: str) -> str:
+    """
+    Rewrites the BigQuery SQL used by TyBot and query_manager into DuckDB
+    SQL: `project.dataset.table` names, double quoted string literals,
+    CURRENT_DATE("UTC-5:00"), the *_DIFF and TIMESTAMP()/DATE() functions,
+    MERGE without INTO, table partitioning and clustering, and @params.
+    """
+    literals = []
+
+    def hide(match):
+        token = match.group(0)
+        if token[0] == "`":
+            parts = token[1:-1].split(".")[-2:]
+            return ".".join('"{}"'.format(part) for part in parts)
+        value = token[1:-1].replace("\\'", "'").replace('\\"', '"')
+        literals.append(value)
+        return _LITERAL.format(len(literals) - 1)
+
+    sql = _QUOTED.sub(hide, sql)
+
+    def current_date(match):
+        zone = literals[int(match.group(1))] if match.group(1) else "UTC"
+        offset = _UTC_OFFSET.match(zone)
+        if zone == "UTC" or offset:
+            minutes = 0
+            if offset:
+                minutes = int(offset.group(2)) * 60 + int(offset.group(3) or 0)
+                minutes = -minutes if offset.group(1) == "-" else minutes
+            return f"CAST(timezone('UTC', now()) + INTERVAL ({minutes}) MINUTE AS DATE)"
+        return f"CAST(timezone('{zone}', now()) AS DATE)"
+
+    sql = re.sub(r"\bCURRENT_DATE\s*\(\s*(?:\x00(\d+)\x00)?\s*\)", current_date, sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bCURRENT_TIMESTAMP\s*\(\s*\)", "now()", sql, flags=re.IGNORECASE)
+    sql = _rewrite_calls(
+        sql, _DIFF_FUNCTIONS,
+        lambda name, args: "date_sub('{}', {}, {})".format(args[2].lower(), args[1], args[0]))
+    sql = _rewrite_calls(
+        sql, _CAST_FUNCTIONS,
+        lambda name, args: "CAST({} AS {})".format(
+            args[0], {"TIMESTAMP": "TIMESTAMPTZ", "DATETIME": "TIMESTAMP"}.get(name, name)))
+    sql = re.sub(r"\bMERGE\s+(?!INTO\b)", "MERGE INTO ", sql, flags=re.IGNORECASE)
+    sql = ";".join(_strip_table_options(statement) for statement in sql.split(";"))
+    sql = re.sub(r"(?<![\w@$])@(\w+)", r"$\1", sql)
+
+    return _LITERAL_REF.sub(
+        lambda match: "'{}'".format(literals[int(match.group(1))].replace("'", "''")), sql)
+
+
+class Row(tuple):
+    """Query row readable by position or by column name, like BigQuery rows."""
+
+    def __new__(cls, values, fields: dict):
+        row = super().__new__(cls, values)
+        row._fields = fields
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._fields[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        index = self._fields.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self):
+        return list(self._fields)
+
+    def items(self):
+        return [(name, tuple.__getitem__(self, index)) for name, index in self._fields.items()]
+
+
+class DuckDBJob(object):
+    """Finished DuckDB query, exposing the parts of a BigQuery job TyBot reads."""
+
+    # results live in memory, there is no destination table to size or to stream from
+    destination = None
+
+    def __init__(self, columns: list, rows: list):
+        fields = {name: index for index, name in enumerate(columns)}
+        self.columns = columns
+        self.rows = [Row(row, fields) for row in rows]
+        self.total_rows = len(self.rows)
+
+    def result(self):
+        return self
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def to_dataframe(self, **kwargs):
+        import pandas as pd
+
+        return pd.DataFrame.from_records([tuple(row) for row in self.rows], columns=self.columns)
+
+    def to_arrow(self, **kwargs):
+        import pyarrow as pa
+
+        return pa.table({name: [row[index] for row in self.rows]
+                         for index, name in enumerate(self.columns)})
+
+    def to_arrow_iterable(self, **kwargs):
+        return iter(self.to_arrow().to_batches())
+
+
+class DuckDBBackend(StorageBackend):
+    """
+    Embedded DuckDB stand-in for the BigQuery dataset, in a file or in
+    memory. Queries written for BigQuery go through `translate_sql`, so the
+    reports run unchanged on local or synthetic data.
+    """
+
+    def __init__(self, path: Optional[str] = None, db_name: str = "jira"):
+        import duckdb
+
+        self.client = duckdb.connect(path or ":memory:")
+        # BigQuery reads TIMESTAMP columns, and casts them to DATE, in UTC
+        self.client.execute("SET TimeZone = 'UTC'")
+        self.dataset_id = db_name
+        self.client.execute('CREATE SCHEMA IF NOT EXISTS "{}"'.format(db_name))
+
+    def table_id(self, table_name: str) -> str:
+        return '"{}"."{}"'.format(self.dataset_id, table_name)
+
+    def query(self, sql: str, job_config=None):
+        params = None
+        if job_config is not None and getattr(job_config, "query_parameters", None):
+            params = {parameter.name: getattr(parameter, "value", getattr(parameter, "values", None))
+                      for parameter in job_config.query_parameters}
+        try:
+            cursor = self.client.execute(translate_sql(sql), params)
+        except Exception:
+            # BigQuery rolls a failed script back, DuckDB leaves its transaction aborted
+            try:
+                self.client.execute("ROLLBACK")
+            except Exception:
+                pass
+            raise
+        if cursor.description is None:
+            return DuckDBJob([], [])
+        return DuckDBJob([column[0] for column in cursor.description], cursor.fetchall())
+
+    def table_exists(self, table_name: str) -> bool:
+        return self.client.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = ? AND table_name = ?",
+            [self.dataset_id, table_name]).fetchone()[0] > 0
+
+    def table_schema(self, table_name: str) -> list:
+        columns = self.client.execute(
+            """
+            SELECT column_name, data_type, is_nullable
+            FROM information_schema.columns
+            WHERE table_schema = ? AND table_name = ?
+            ORDER BY ordinal_position
+            """, [self.dataset_id, table_name]).fetchall()
+        if not columns:
+            raise NotFound("Table {} not found".format(table_name))
+        return [
+            bigquery.SchemaField(
+                name, "NUMERIC" if data_type.startswith("DECIMAL") else BIGQUERY_TYPES.get(data_type, "STRING"),
+                mode="NULLABLE" if is_nullable == "YES" else "REQUIRED")
+            for name, data_type, is_nullable in columns
+        ]
+
+    def create_table(self, table_name: str, schema: list, partition_field: Optional[str] = None,
+                     clustering_fields: Optional[list] = None):
+        columns = ", ".join(
+            "{} {}{}".format(field.name, DUCKDB_TYPES[field.field_type],
+                             " NOT NULL" if field.mode == "REQUIRED" else "")
+            for field in schema)
+        self.client.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(self.table_id(table_name), columns))
+        return self.table_schema(table_name)
+
+    def delete_table(self, table_name: str) -> bool:
+        exists = self.table_exists(table_name)
+        self.client.execute("DROP TABLE IF EXISTS {}".format(self.table_id(table_name)))
+        return exists
+
+    def insert_rows(self, table_name: str, rows: list) -> list:
+        self.load_rows(table_name, rows)
+        return []
+
+    def load_rows(self, table_name: str, records: Iterable, schema: Optional[list] = None,
+                  truncate: bool = False, staging: Optional[str] = None) -> int:
+        import pandas as pd
+
+        schema = schema or self.table_schema(table_name)
+        names = [field.name for field in schema]
+        # staged as text and cast on insert, the way load jobs read NDJSON values
+        staged = pd.DataFrame.from_records(
+            [[None if record.get(name) is None else str(record.get(name)) for name in names]
+             for record in records], columns=names)
+        if truncate:
+            self.client.execute("DELETE FROM {}".format(self.table_id(table_name)))
+        if staged.empty:
+            return 0
+        self.client.register("staged_rows", staged)
+        try:
+            self.client.execute("INSERT INTO {} ({}) SELECT {} FROM staged_rows".format(
+                self.table_id(table_name), ", ".join(names),
+                ", ".join("CAST({} AS {})".format(field.name, DUCKDB_TYPES[field.field_type])
+                          for field in schema)))
+        finally:
+            self.client.unregister("staged_rows")
+        return len(staged)
+
+    def relax_columns(self, table_name: str, columns: list):
+        for field in self.table_schema(table_name):
+            if field.name in columns and field.mode == "REQUIRED":
+                self.client.execute("ALTER TABLE {} ALTER COLUMN {} DROP NOT NULL".format(
+                    self.table_id(table_name), field.name))
+
+    def migrate_table_layout(self, table_name: str, partition_field: str, clustering_fields: list):
+        # DuckDB has no partitioning or clustering to migrate to
+        return self.table_schema(table_name)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+def storage_backend(project_id, db_name, backend: Optional[str] = None) -> StorageBackend:
+    """The backend configured through STORAGE_BACKEND, "bigquery" or "duckdb"."""
+    backend = backend or Config.STORAGE_BACKEND
+    if backend == "duckdb":
+        return DuckDBBackend(Config.DUCKDB_PATH, db_name or "jira")
+    if backend != "bigquery":
+        raise ValueError("Unknown storage backend: {}".format(backend))
+    return BigQueryBackend(project_id, db_name)
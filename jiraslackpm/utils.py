@@ -1,16 +1,53 @@
 import json
-import pandas as pd
-from typing import Union
+import os
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Optional, Union
+
+from config import Config
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+USERS_COLUMNS = ['id', 'name', 'email', 'active']
+USERS_DTYPES = {'id': str, 'name': str, 'email': str, 'active': 'category'}
 
 
 def print_json(data: Union[dict, list], indent: int = 4) -> None:
     print(json.dumps(data, sort_keys=True, indent=indent, separators=(",", ": ")))
 
-def get_users_info() -> pd.DataFrame:
-    data = pd.read_csv("./data/export-users.csv")
-    groupby_cols = ['id', 'name', 'email','active']
-    users_data = data.groupby(groupby_cols).count()
-    users_df = pd.DataFrame.from_records(users_data.index, columns = groupby_cols)
-    active_users = users_df[users_df['active'] == 'Yes']
-    
+def get_users_info(path: Optional[str] = None, chunksize: int = 50000) -> "pd.DataFrame":
+    """
+    Active users of the directory export, one row per id, name and email.
+    Only the needed columns are read, in chunks that are filtered as they
+    stream in. The result is cached next to the CSV, as Feather when pyarrow
+    is installed and as a pickle otherwise, until the CSV is modified.
+    """
+    # pandas takes a while to import, only the users sync needs it
+    import pandas as pd
+
+    path = path or Config.USERS_EXPORT_PATH
+    cache_path = path + (".feather" if find_spec("pyarrow") else ".pkl")
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        if cache_path.endswith(".feather"):
+            return pd.read_feather(cache_path)
+        return pd.read_pickle(cache_path)
+
+    chunks = pd.read_csv(path, usecols=USERS_COLUMNS, dtype=USERS_DTYPES, chunksize=chunksize)
+    active_chunks = [chunk[chunk['active'] == 'Yes'] for chunk in chunks]
+    if active_chunks:
+        users_df = pd.concat(active_chunks)
+    else:
+        users_df = pd.DataFrame(columns=USERS_COLUMNS)
+    active_users = (users_df[USERS_COLUMNS]
+                    .dropna()
+                    .drop_duplicates()
+                    .astype({'active': 'category'})
+                    .reset_index(drop=True))
+
+    tmp_path = cache_path + ".tmp"
+    if cache_path.endswith(".feather"):
+        active_users.to_feather(tmp_path)
+    else:
+        active_users.to_pickle(tmp_path)
+    os.replace(tmp_path, cache_path)
     return active_users
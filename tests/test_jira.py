@@ -0,0 +1,168 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+import dateutil.parser
+import pytest
+
+import jira
+from jira import CustomFields, parse_jira_datetime
+from response_cache import ResponseCacheMiss
+
+
+@pytest.mark.parametrize("value", [
+    "2021-03-09T14:05:33.123-0500",
+    "2021-03-09T14:05:33.000+0000",
+    "2021-12-31T23:59:59.999+0530",
+    "2021-03-09T14:05:33.123Z",
+    "2021-03-09T14:05:33-05:00",
+    "2021-03-09",
+])
+def test_parse_jira_datetime_matches_dateutil(value):
+    assert parse_jira_datetime(value) == dateutil.parser.parse(value)
+
+
+def test_parse_jira_datetime_keeps_the_offset():
+    parsed = parse_jira_datetime("2021-03-09T14:05:33.123-0500")
+    assert parsed == datetime(2021, 3, 9, 14, 5, 33, 123000, timezone(timedelta(hours=-5)))
+    assert parsed.utcoffset() == timedelta(hours=-5)
+
+
+@pytest.mark.parametrize("value", [None, ""])
+def test_parse_jira_datetime_of_nothing(value):
+    assert parse_jira_datetime(value) is None
+
+ISSUE = {
+    "id": "10001",
+    "key": "TY-1",
+    "fields": {
+        "status": {"name": "ENV: QA", "statusCategory": {"name": "In Progress"}},
+        "project": {"name": "Tyba"},
+        "components": [{"name": "Fury"}],
+        "summary": "Some issue",
+        "assignee": {"accountId": "user-1"},
+        "priority": None,
+        "created": "2021-03-01T09:00:00.000-0500",
+        "updated": "2021-03-09T14:05:33.123-0500",
+        "issuetype": {"name": "Story"},
+    },
+}
+
+
+def test_parse_issue_matches_get_info_from_issue(monkeypatch):
+    monkeypatch.setattr(jira.CustomFields, "ids", CustomFields.FALLBACKS)
+    assert jira.parse_issue(ISSUE) == jira.get_info_from_issue(ISSUE)
+    assert jira.parse_issue(ISSUE)["project_name"] == "Fury"
+
+
+def test_parse_issue_reuses_the_parsed_update(monkeypatch):
+    monkeypatch.setattr(jira.CustomFields, "ids", CustomFields.FALLBACKS)
+    updated_at = parse_jira_datetime(ISSUE["fields"]["updated"])
+    parsed = []
+    monkeypatch.setattr(jira, "parse_jira_datetime", lambda value: parsed.append(value) or updated_at)
+    assert jira.parse_issue(ISSUE, updated_at)["updated_at"] == str(updated_at)
+    assert parsed == [ISSUE["fields"]["created"]]
+
+
+def test_issue_fields_cover_the_parsed_paths(monkeypatch):
+    monkeypatch.setattr(jira.CustomFields, "ids", CustomFields.FALLBACKS)
+    assert set(jira.issue_fields()) >= {keys[0] for keys in jira.ISSUE_FIELD_KEYS.values()}
+
+
+FIELDS = [
+    {"id": "summary", "name": "Summary", "custom": False},
+    {"id": "customfield_10028", "name": "Story point estimate", "custom": True},
+    {"id": "customfield_10200", "name": "Story Points", "custom": True},
+    {"id": "customfield_10100", "name": "Story Points", "custom": True},
+    {"id": "customfield_10021", "name": "Sprint", "custom": True},
+    {"id": "customfield_10300", "name": "Tester", "custom": True},
+]
+
+
+def resolve_with(monkeypatch, call_api):
+    monkeypatch.setattr(jira, "call_api", call_api)
+    return CustomFields(enabled=True).resolve()
+
+
+def test_resolve_takes_the_oldest_field_of_the_first_name(monkeypatch):
+    ids = resolve_with(monkeypatch, lambda uri: FIELDS)
+    assert ids == {"story_points": "customfield_10100", "sprint": "customfield_10021",
+                   "tester": "customfield_10300"}
+
+
+def test_resolve_prefers_the_configured_id(monkeypatch):
+    fields = FIELDS + [{"id": CustomFields.FALLBACKS["story_points"], "name": "Story Points", "custom": True}]
+    ids = resolve_with(monkeypatch, lambda uri: fields)
+    assert ids["story_points"] == CustomFields.FALLBACKS["story_points"]
+
+
+def test_resolve_keeps_the_fallback_of_missing_names(monkeypatch):
+    ids = resolve_with(monkeypatch, lambda uri: FIELDS[:2])
+    assert ids == dict(CustomFields.FALLBACKS, story_points="customfield_10028")
+
+
+def test_resolve_falls_back_on_error_responses(monkeypatch):
+    ids = resolve_with(monkeypatch, lambda uri: {"errorMessages": ["Unauthorized"]})
+    assert ids == CustomFields.FALLBACKS
+
+
+def test_resolve_falls_back_on_offline_cache_misses(monkeypatch):
+    def call_api(uri):
+        raise ResponseCacheMiss(uri)
+
+    assert resolve_with(monkeypatch, call_api) == CustomFields.FALLBACKS
+
+
+def test_resolve_disabled_uses_the_fallbacks(monkeypatch):
+    monkeypatch.setattr(jira, "call_api", lambda uri: pytest.fail("metadata fetched"))
+    assert CustomFields(enabled=False).resolve() == CustomFields.FALLBACKS
+
+
+class FakeSearch(object):
+    """Site search over in-memory issues, honouring the `updated >=` bound of the JQL."""
+
+    def __init__(self, issues, on_page=None):
+        self.issues = issues
+        self.on_page = on_page
+        self.calls = 0
+
+    def __call__(self, uri, params=None):
+        bound = re.search(r'updated >= "([^"]+)"', params["jql"])
+        matches = sorted(self.issues.values(), key=lambda issue: (issue["fields"]["updated"], issue["key"]))
+        if bound:
+            since = jira.pytz.timezone(jira.Config.JIRA_TIMEZONE).localize(
+                datetime.strptime(bound.group(1), "%Y/%m/%d %H:%M"))
+            matches = [issue for issue in matches if parse_jira_datetime(issue["fields"]["updated"]) >= since]
+        page = matches[params["startAt"]:params["startAt"] + params["maxResults"]]
+        self.calls += 1
+        if self.on_page:
+            self.on_page(self)
+        return {"issues": [dict(issue) for issue in page], "total": len(matches)}
+
+
+def fake_issue(number, minute):
+    updated = "2021-03-09T10:{:02d}:00.000-0500".format(minute)
+    return {"id": str(number), "key": "TY-{}".format(number), "fields": {"updated": updated}}
+
+
+def test_search_does_not_skip_issues_updated_mid_crawl(monkeypatch):
+    monkeypatch.setattr(jira, "SEARCH_PAGE_SIZE", 3)
+    issues = {number: fake_issue(number, number) for number in range(10)}
+
+    def touch_first_issue(search):
+        # the oldest issue changes after the first page, moving to the end
+        if search.calls == 1:
+            issues[0] = fake_issue(0, 59)
+
+    monkeypatch.setattr(jira, "call_api", FakeSearch(issues, touch_first_issue))
+    found = [(issue["id"], issue["fields"]["updated"]) for page in jira.iter_search("") for issue in page]
+    assert len(found) == len(set(found))
+    assert {issue_id for issue_id, updated in found} == {str(number) for number in range(10)}
+    assert ("0", fake_issue(0, 59)["fields"]["updated"]) in found
+
+
+def test_search_walks_a_minute_with_more_than_a_page(monkeypatch):
+    monkeypatch.setattr(jira, "SEARCH_PAGE_SIZE", 3)
+    issues = {number: fake_issue(number, 5 if number < 8 else number) for number in range(12)}
+    monkeypatch.setattr(jira, "call_api", FakeSearch(issues))
+    found = [issue["id"] for page in jira.iter_search("") for issue in page]
+    assert sorted(found, key=int) == [str(number) for number in range(12)]
@@ -0,0 +1,19 @@
+from datetime import datetime, timedelta, timezone
+
+import query_manager
+
+
+def test_report_as_of_is_the_current_utc_hour():
+    now = datetime(2021, 3, 10, 7, 42, 5, 123, tzinfo=timezone(timedelta(hours=-5)))
+    assert query_manager.report_as_of(now) == datetime(2021, 3, 10, 12, tzinfo=timezone.utc)
+
+
+def test_warning_queries_bind_the_current_time():
+    as_of = datetime(2021, 3, 10, 12, tzinfo=timezone.utc)
+    sql, job_config = query_manager.warning_issues_qa("p.d", as_of=as_of)
+    assert "CURRENT_" not in sql
+    parameters = {parameter.name: parameter.value for parameter in job_config.query_parameters}
+    assert parameters["as_of"] == as_of
+    assert parameters["stage"] == "ENV: QA"
+    # reruns within the hour send the same text and parameters
+    assert query_manager.warning_issues_qa("p.d")[0] == sql
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+from response_cache import DEFAULT_TTLS, ResponseCache, ResponseCacheMiss, parse_ttls
+
+BASE_URL = "https://example.atlassian.net/rest/"
+
+
+class FakeResponse(object):
+    def __init__(self, payload, status_code=200, headers=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode("utf-8")
+
+    def json(self):
+        return self.payload
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_bytes=1024, ttls=dict(DEFAULT_TTLS))
+    yield cache
+    cache.close()
+
+
+@pytest.mark.parametrize("path, ttl", [
+    ("agile/1.0/board", 86400),
+    ("agile/1.0/board/12/sprint", 3600),
+    ("agile/1.0/board/12/sprint/", 3600),
+    ("api/3/field", 86400),
+    ("api/3/users/search", 86400),
+    ("api/3/search", 0),
+    ("api/3/issue/TY-1", 0),
+])
+def test_ttl_by_endpoint(cache, path, ttl):
+    assert cache.ttl(BASE_URL + path) == ttl
+
+
+def test_ttl_overrides_come_first():
+    ttls = parse_ttls(r"agile/1\.0/board/\d+/sprint$=60,api/3/search$=30")
+    cache = ResponseCache(":memory:", ttls=ttls)
+    assert cache.ttl(BASE_URL + "agile/1.0/board/12/sprint") == 60
+    assert cache.ttl(BASE_URL + "api/3/search") == 30
+    assert cache.ttl(BASE_URL + "agile/1.0/board") == 86400
+
+
+def test_evicts_least_recently_used(cache):
+    body = b"x" * 400
+    cache.put("a", "a", body)
+    cache.put("b", "b", body)
+    cache.get("a")
+    cache.put("c", "c", body)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.total_bytes == 800
+
+
+def test_total_bytes_survives_replacements_and_reopening(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path, ttls={})
+    cache.put("a", "a", b"x" * 400)
+    cache.put("a", "a", b"x" * 100)
+    assert cache.total_bytes == 100
+    cache.close()
+    cache = ResponseCache(path, ttls={})
+    assert cache.total_bytes == 100
+    cache.close()
+
+
+def test_fresh_responses_skip_the_request(cache):
+    uri = BASE_URL + "api/3/field"
+    sent = []
+
+    def send(headers):
+        sent.append(headers)
+        return FakeResponse([{"id": "customfield_10016"}], headers={"ETag": "v1"})
+
+    assert cache.fetch(uri, None, send) == [{"id": "customfield_10016"}]
+    assert cache.fetch(uri, None, send) == [{"id": "customfield_10016"}]
+    assert len(sent) == 1
+
+
+def test_zero_ttl_responses_are_not_stored(cache):
+    uri = BASE_URL + "api/3/search"
+    cache.fetch(uri, None, lambda headers: FakeResponse({"issues": []}))
+    assert cache.get(cache.key(uri)) is None
+    assert cache.total_bytes == 0
+
+
+def test_stale_responses_are_revalidated(cache):
+    cache.record = True
+    uri = BASE_URL + "api/3/search"
+    cache.fetch(uri, None, lambda headers: FakeResponse({"issues": []}, headers={"ETag": "v1"}))
+    sent = []
+
+    def send(headers):
+        sent.append(headers)
+        return FakeResponse(None, status_code=304)
+
+    assert cache.fetch(uri, None, send) == {"issues": []}
+    assert sent == [{"If-None-Match": "v1"}]
+
+
+def test_offline_miss_raises(tmp_path):
+    cache = ResponseCache(str(tmp_path / "offline.sqlite"), ttls={}, offline=True)
+    with pytest.raises(ResponseCacheMiss):
+        cache.fetch(BASE_URL + "api/3/field", None, lambda headers: FakeResponse([]))
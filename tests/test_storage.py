@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from storage import translate_sql
+
+
+def test_table_names_keep_dataset_and_table():
+    assert translate_sql("SELECT * FROM `project.jira.Issue`") == 'SELECT * FROM "jira"."Issue"'
+
+
+def test_double_quoted_literals_become_single_quoted():
+    sql = translate_sql("""SELECT "it's" FROM t WHERE stage = "ENV: DEV" """)
+    assert sql.strip() == "SELECT 'it''s' FROM t WHERE stage = 'ENV: DEV'"
+
+
+def test_current_date_with_utc_offset():
+    assert translate_sql('SELECT CURRENT_DATE("UTC-5:00")') == (
+        "SELECT CAST(timezone('UTC', now()) + INTERVAL (-300) MINUTE AS DATE)")
+
+
+def test_diff_functions_swap_their_arguments():
+    assert translate_sql("SELECT TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), updated_at, DAY)") == (
+        "SELECT date_sub('day', updated_at, now())")
+
+
+def test_timestamp_and_date_become_casts():
+    assert translate_sql('SELECT TIMESTAMP("2021-01-01"), DATE(x)') == (
+        "SELECT CAST('2021-01-01' AS TIMESTAMPTZ), CAST(x AS DATE)")
+
+
+def test_merge_gets_into():
+    assert translate_sql("MERGE `p.d.T` AS t USING s ON t.a = s.a WHEN MATCHED THEN DELETE") == (
+        'MERGE INTO "d"."T" AS t USING s ON t.a = s.a WHEN MATCHED THEN DELETE')
+
+
+def test_create_table_drops_partitioning_and_clustering():
+    sql = translate_sql("""
+        CREATE TABLE IF NOT EXISTS `p.d.T`
+        PARTITION BY DATE(updated_at)
+        CLUSTER BY a, b
+        AS SELECT 1""")
+    assert "PARTITION" not in sql and "CLUSTER" not in sql
+    assert sql.split() == ["CREATE", "TABLE", "IF", "NOT", "EXISTS", '"d"."T"', "AS", "SELECT", "1"]
+
+
+def test_parameters_outside_literals_only():
+    assert translate_sql('SELECT a FROM t WHERE b = @stage AND c = "@stage"') == (
+        "SELECT a FROM t WHERE b = $stage AND c = '@stage'")
+
+
+def test_timestamp_diff_counts_whole_days_on_duckdb():
+    duckdb = pytest.importorskip("duckdb")
+    as_of = datetime(2021, 3, 10, 12, tzinfo=timezone.utc)
+    connection = duckdb.connect()
+    connection.execute("SET TimeZone = 'UTC'")
+    query = translate_sql("SELECT TIMESTAMP_DIFF(@as_of, @updated_at, DAY)")
+    days = [connection.execute(query, {"as_of": as_of, "updated_at": as_of - delta}).fetchone()[0]
+            for delta in (timedelta(hours=23), timedelta(days=1), timedelta(days=7, hours=23))]
+    assert days == [0, 1, 7]